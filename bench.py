@@ -0,0 +1,546 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import websockets
+
+from display import FakeDisplay
+from executor import CommandExecutor, StubCommand, StubExecutor
+from gpio_handler import SimulatedGPIO
+from heartbeat import HEARTBEAT_MODES, VOLATILE_FIELDS, HeartbeatDecoder, HeartbeatEncoder
+from logs import LogPipeline, get_logger
+from metrics import Histogram
+from panel_controller import PanelController
+from scheduler import HeartbeatScheduler
+from standin_server import StandInServer
+from telemetry import SystemTelemetry, ThermalReader
+
+
+async def measure_loop_lag(work, tick=0.01):
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(tick)
+            lags.append(time.perf_counter() - start - tick)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(tick)
+    try:
+        await work()
+    finally:
+        done.set()
+        await ticker_task
+    return lags
+
+
+def report(label, lags):
+    lags = sorted(lags)
+    if not lags:
+        print(f"{label:<28} no samples")
+        return
+    p50 = lags[len(lags) // 2] * 1000
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000
+    print(f"{label:<28} samples={len(lags):<5} p50={p50:7.2f}ms p99={p99:7.2f}ms max={lags[-1] * 1000:7.2f}ms")
+
+
+async def bench_loop_latency(args):
+    hang = args.hang
+
+    async def blocking():
+        subprocess.run(["sleep", str(hang)])
+
+    async def real_process():
+        await CommandExecutor(timeout=hang).run("sleep", str(hang * 10))
+
+    async def stub_process():
+        executor = StubExecutor({"xrandr": StubCommand(hang=True)}, timeout=hang)
+        await executor.run("xrandr", "--output", "HDMI-1", "--auto")
+
+    report("blocking subprocess.run", await measure_loop_lag(blocking))
+    report("executor, real hung child", await measure_loop_lag(real_process))
+    report("executor, stub hung xrandr", await measure_loop_lag(stub_process))
+
+
+def make_fake_thermal_root(directory, zones=3):
+    for index in range(zones):
+        zone = os.path.join(directory, f"thermal_zone{index}")
+        os.makedirs(zone)
+        with open(os.path.join(zone, "temp"), "w") as f:
+            f.write(f"{45000 + index * 1000}\n")
+        with open(os.path.join(zone, "type"), "w") as f:
+            f.write(f"zone{index}-thermal\n")
+    return directory
+
+
+async def bench_telemetry(args):
+    with tempfile.TemporaryDirectory() as directory:
+        root = args.root or make_fake_thermal_root(directory)
+        pattern = os.path.join(root, "thermal_zone*", "temp")
+
+        def fork_per_read():
+            output = subprocess.check_output(f"cat {pattern}", shell=True)
+            return math.floor(int(output.splitlines()[0]) / 1000.0)
+
+        reader = ThermalReader(root)
+        print(f"{len(reader.zones)} thermal zones under {root}")
+        for label, read in (("fork per read (sh + cat)", fork_per_read),
+                            ("ThermalReader pread", reader.cpu_temperature)):
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                read()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<28} {elapsed / args.iterations * 1e6:10.1f}us/read")
+
+        executor = CommandExecutor()
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            await executor.run("sh", "-c", f"cat {pattern}")
+        elapsed = time.perf_counter() - start
+        print(f"{'async executor (sh + cat)':<28} {elapsed / args.iterations * 1e6:10.1f}us/read")
+
+        telemetry = SystemTelemetry(root)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            telemetry.system_metrics()
+        elapsed = time.perf_counter() - start
+        print(f"{'psutil system metrics':<28} {elapsed / args.iterations * 1e6:10.1f}us/sample")
+        reader.close()
+        telemetry.close()
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append((time.monotonic(), message))
+
+
+def make_controller(gpio=None, display_delay=0.0):
+    controller = PanelController(executor=StubExecutor(), display=FakeDisplay(delay=display_delay), gpio=gpio or SimulatedGPIO())
+    controller.connection.spool.path = os.path.join(tempfile.mkdtemp(prefix="panel-bench-"), "spool.jsonl")
+    return controller
+
+
+def attach_recorder(controller):
+    websocket = RecordingWebSocket()
+    controller.connection.websocket = websocket
+    controller.connection.outbox.attach(websocket)
+    return websocket
+
+
+async def bench_gpio_latency(args):
+    gpio = SimulatedGPIO()
+    controller = make_controller(gpio)
+    controller.gpio.debounce = args.debounce
+    controller.gpio.attach(asyncio.get_running_loop())
+    attach_recorder(controller)
+    sensor_task = asyncio.create_task(controller.send_sensor_events())
+
+    latencies = []
+    for index in range(args.edges):
+        level = gpio.HIGH if index % 2 == 0 else gpio.LOW
+        edge_at = time.monotonic()
+        gpio.set_input(controller.gpio.door_sensor_pin, level)
+        while len(controller.connection.websocket.sent) <= index:
+            await asyncio.sleep(0.0005)
+        latencies.append(controller.connection.websocket.sent[index][0] - edge_at)
+    sensor_task.cancel()
+    await controller.connection.outbox.detach()
+    controller.cleanup()
+    print(f"debounce={args.debounce * 1000:.0f}ms, heartbeat polling would add up to {controller.heartbeat_interval}s")
+    report("edge to sensorEvent sent", latencies)
+
+
+def instruction_flood(count, duplicate_ratio, seed=1):
+    rng = random.Random(seed)
+    sent = []
+    for index in range(count):
+        if sent and rng.random() < duplicate_ratio:
+            yield rng.choice(sent)
+            continue
+        message = json.dumps({
+            "type": "instruction", "to": "panel", "instructionId": f"i{index}",
+            "instruction": rng.choice(("on", "off", "on", "off", "refresh")),
+        })
+        sent.append(message)
+        yield message
+
+
+async def bench_instruction_flood(args):
+    messages = list(instruction_flood(args.instructions, args.duplicates))
+    unique = len(set(messages))
+
+    # Before: every message was executed and acknowledged inline in the receive loop
+    controller = make_controller(display_delay=args.display_delay)
+    attach_recorder(controller)
+    start = time.perf_counter()
+    for message in messages:
+        data = json.loads(message)
+        status = await controller.process_instruction(data["instruction"])
+        await controller.send_acknowledgement(data["instructionId"], status)
+        await asyncio.sleep(0)  # Let the sender write it, as the inline send used to
+    inline = time.perf_counter() - start
+    await controller.connection.outbox.detach()
+    controller.cleanup()
+
+    controller = make_controller(display_delay=args.display_delay)
+    attach_recorder(controller)
+    dispatcher = controller.dispatcher
+    start = time.perf_counter()
+    for message in messages:
+        await controller.handle_message(message, controller.connection.websocket)
+    received = time.perf_counter() - start
+    await dispatcher.drain()
+    await controller.connection.outbox.wait_sent(5)
+    dispatched = time.perf_counter() - start
+    acks = sum(1 for _, message in controller.connection.websocket.sent if '"acknowledgement"' in message)
+    await controller.connection.outbox.detach()
+    controller.cleanup()
+
+    print(f"{len(messages)} instructions ({unique} unique), display command {args.display_delay * 1000:.0f}ms")
+    print(f"{'inline':<12} {inline:7.3f}s  {len(messages) / inline:9.0f} instructions/s  executed={len(messages)}")
+    print(f"{'dispatcher':<12} {dispatched:7.3f}s  {len(messages) / dispatched:9.0f} instructions/s  "
+          f"executed={dispatcher.executed} superseded={dispatcher.superseded} duplicates={dispatcher.duplicates} "
+          f"acks={acks} receive loop busy {received * 1000:.1f}ms")
+
+
+async def bench_heartbeat_timing(args):
+    interval, cost, beats = args.interval, args.send_cost, args.beats
+
+    async def send():
+        time.sleep(cost)  # Building and sending a heartbeat holds the loop for this long
+
+    async def sleep_loop():
+        ticks = []
+        while len(ticks) < beats:
+            ticks.append(time.monotonic())
+            await send()
+            await asyncio.sleep(interval)
+        return ticks
+
+    async def scheduled(scheduler):
+        ticks = []
+        async for tick in scheduler.ticks():
+            ticks.append(tick)
+            await send()
+            if len(ticks) == beats:
+                return ticks
+
+    def summarize(label, ticks, expected):
+        periods = [b - a for a, b in zip(ticks, ticks[1:])]
+        drift = ticks[-1] - ticks[0] - sum(expected[:len(periods)])
+        errors = [abs(period - want) for period, want in zip(periods, expected)]
+        print(f"{label:<26} drift={drift * 1000:8.2f}ms  mean period error={sum(errors) / len(errors) * 1000:6.2f}ms  "
+              f"max={max(errors) * 1000:6.2f}ms")
+
+    print(f"{beats} heartbeats every {interval * 1000:.0f}ms, {cost * 1000:.0f}ms per send")
+    summarize("sleep after send", await sleep_loop(), [interval] * beats)
+    summarize("HeartbeatScheduler", await scheduled(HeartbeatScheduler(interval)), [interval] * beats)
+
+    # Runtime change pushed by the server halfway through
+    scheduler = HeartbeatScheduler(interval)
+    ticks = []
+    async for tick in scheduler.ticks():
+        ticks.append(tick)
+        await send()
+        if len(ticks) == beats // 2:
+            scheduler.set_interval(interval * 2)
+        if len(ticks) == beats:
+            break
+    half = beats // 2
+    summarize("after set_interval(x2)", ticks[half:], [interval * 2] * beats)
+
+    # Adaptive: fast while active, idle otherwise
+    scheduler = HeartbeatScheduler(interval, fast_interval=interval / 2, idle_interval=interval * 2, active_hold=interval * 5)
+    scheduler.mark_active()
+    ticks = []
+    async for tick in scheduler.ticks():
+        ticks.append(tick)
+        if len(ticks) == 12:
+            break
+    periods = ", ".join(f"{(b - a) * 1000:.0f}" for a, b in zip(ticks, ticks[1:]))
+    print(f"{'adaptive periods (ms)':<26} {periods}")
+
+
+def simulated_heartbeats(count, interval, seed=1):
+    rng = random.Random(seed)
+    data = {
+        "type": "heartbeat", "state": "on", "cpuTemp": 52, "sectorStatus": True, "isDoorOpen": False,
+        "maintenanceMode": False, "name": "panel-0001", "cpuLoad": 12.5, "memoryUsage": 31.2,
+        "diskUsage": 44.0, "uptime": 86400, "loopLagP99": 3, "loopLagMax": 9, "rttP50": 24, "ackP99": 180,
+        "heartbeatSendP99": 1,
+    }
+    for _ in range(count):
+        data["uptime"] += interval
+        data["cpuLoad"] = round(max(0.0, min(100.0, data["cpuLoad"] + rng.uniform(-3, 3))), 1)
+        if rng.random() < 0.2:
+            data["cpuTemp"] += rng.choice((-1, 1))
+        if rng.random() < 0.05:
+            data["memoryUsage"] = round(data["memoryUsage"] + rng.uniform(-0.5, 0.5), 1)
+        if rng.random() < 0.002:
+            data["isDoorOpen"] = not data["isDoorOpen"]
+        data["loopLagP99"] = max(1, data["loopLagP99"] + rng.choice((-1, 0, 1)))
+        data["loopLagMax"] = max(data["loopLagP99"], data["loopLagMax"] + rng.choice((-2, 0, 2)))
+        data["rttP50"] = max(1, data["rttP50"] + rng.randint(-2, 2))
+        data["ackP99"] = max(10, data["ackP99"] + rng.randint(-10, 10))
+        yield dict(data)
+
+
+def websocket_frame_size(payload_size):
+    # Client frames are masked: 2 byte header + 4 byte mask, longer lengths need 2 more bytes
+    return payload_size + (6 if payload_size < 126 else 8)
+
+
+async def bench_heartbeat_size(args):
+    count = int(3600 / args.interval)
+    print(f"{count} heartbeats per panel per hour at {args.interval}s, keyframe every {args.keyframe_interval}")
+    for mode in reversed(HEARTBEAT_MODES):
+        encoder = HeartbeatEncoder(mode, args.keyframe_interval)
+        decoder = HeartbeatDecoder()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -args.window_bits, 5)
+        raw = deflated = 0
+        for data in simulated_heartbeats(count, args.interval):
+            frame = encoder.encode(data)
+            payload = frame if isinstance(frame, bytes) else frame.encode()
+            decoded = decoder.decode(frame)
+            assert all(decoded[key] == value for key, value in data.items() if key not in VOLATILE_FIELDS)
+            compressed = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            raw += websocket_frame_size(len(payload))
+            deflated += websocket_frame_size(len(compressed) - 4)
+        print(f"{mode:<8} plain {raw / 1024:8.1f} KiB/h   permessage-deflate {deflated / 1024:8.1f} KiB/h")
+
+
+async def bench_metrics(args):
+    histogram = Histogram()
+    start = time.perf_counter()
+    for index in range(args.observations):
+        histogram.observe(index % 1000 / 1e4)
+    print(f"{'Histogram.observe':<28} {(time.perf_counter() - start) / args.observations * 1e9:8.0f}ns/call")
+
+    controller = make_controller(display_delay=args.display_delay)
+    controller.connection.metrics_port = args.port
+    await controller.start_instrumentation()
+    attach_recorder(controller)
+    for message in instruction_flood(args.instructions, 0.1):
+        await controller.handle_message(message, controller.connection.websocket)
+        await asyncio.sleep(args.display_delay)
+    await controller.dispatcher.drain()
+    for _ in range(args.heartbeats):
+        await controller.send_heartbeat_to_server()
+        await asyncio.sleep(0.01)
+    await controller.connection.outbox.wait_sent(5)
+
+    for label, enabled in (("heartbeat build, no summary", False), ("heartbeat build, summary", True)):
+        controller.connection.metrics_in_heartbeat = enabled
+        start = time.perf_counter()
+        for _ in range(args.heartbeats):
+            await controller.send_heartbeat_to_server()
+        print(f"{label:<28} {(time.perf_counter() - start) / args.heartbeats * 1e6:8.1f}us/heartbeat")
+    print("heartbeat summary", json.dumps(controller.metrics.summary()))
+
+    if args.port:
+        def scrape():
+            import urllib.request
+            with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/metrics", timeout=5) as response:
+                return response.read().decode()
+        text = await asyncio.to_thread(scrape)
+        controller.connection.metrics_server.close()
+    else:
+        text = controller.metrics.render()
+    lines = text.splitlines()
+    print(f"{len(lines)} exposition lines, for example:")
+    for line in lines:
+        if not line.startswith("#") and ("_count" in line or "_total" in line):
+            print("  " + line)
+    controller.connection.watchdog_task.cancel()
+    await controller.connection.outbox.detach()
+    controller.cleanup()
+
+
+def import_time(module):
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                     stderr=subprocess.DEVNULL)
+    return float(output.decode().split()[-1])
+
+
+async def bench_startup(args):
+    for module in ("panel_controller", "websockets", "psutil"):
+        samples = [import_time(module) for _ in range(args.runs)]
+        print(f"{'import ' + module:<28} median {statistics.median(samples) * 1000:7.1f}ms")
+
+    # Whole client as a fresh process on the mock backend against a local stand-in server
+    server = StandInServer()
+    client = os.path.join(os.path.dirname(os.path.abspath(__file__)), "websocket-client.py")
+    registered, heartbeat = [], []
+    async with websockets.serve(server.handler, "127.0.0.1", args.port):
+        for run in range(args.runs):
+            name = f"startup-{run}"
+            with tempfile.TemporaryDirectory(prefix="panel-startup-") as directory:
+                env = dict(os.environ, HARDWARE="mock", MOCK_COMMAND_DELAY=str(args.command_delay),
+                           URI="ws://127.0.0.1", PORT=str(args.port), CLIENT_NAME=name, CLIENT_TYPE="panel",
+                           SPOOL_PATH=os.path.join(directory, "spool.jsonl"), LOG_LEVEL="WARNING")
+                started = time.monotonic()
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, client, env=env, cwd=directory,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+                deadline = started + 30
+                while not server.heartbeats.get(name) and time.monotonic() < deadline:
+                    await asyncio.sleep(0.005)
+                process.terminate()
+                await process.wait()
+            if name in server.registered_at and server.heartbeats.get(name):
+                registered.append(server.registered_at[name] - started)
+                heartbeat.append(server.heartbeats[name][0] - started)
+    print(f"mock hardware, {args.command_delay * 1000:.0f}ms per xrandr/xset, {len(registered)}/{args.runs} runs")
+    for label, samples in (("spawn to register", registered), ("spawn to first heartbeat", heartbeat)):
+        if samples:
+            print(f"{label:<28} median {statistics.median(samples) * 1000:7.1f}ms  max {max(samples) * 1000:7.1f}ms")
+
+
+class FileSink:
+    def __init__(self):
+        self.stream = tempfile.TemporaryFile("w", buffering=1)
+
+    def close(self):
+        self.stream.close()
+
+
+class SlowPipe:
+    """Pipe drained by a thread at ``rate`` bytes per second, like a busy journald."""
+
+    def __init__(self, rate):
+        self.read_fd, write_fd = os.pipe()
+        self.rate = rate
+        self.stream = os.fdopen(write_fd, "w", buffering=1)
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while os.read(self.read_fd, 4096):
+            time.sleep(4096 / self.rate)
+
+    def close(self):
+        self.stream.close()
+        self.thread.join()
+        os.close(self.read_fd)
+
+
+async def bench_log_overhead(args):
+    message = json.dumps({"type": "instruction", "to": "panel", "instruction": "on", "instructionId": "a" * 32})
+
+    async def run(label, sink, emit, stop=None):
+        spent = 0.0
+
+        async def work():
+            nonlocal spent
+            for _ in range(args.bursts):
+                start = time.perf_counter()
+                for _ in range(args.burst):
+                    emit(sink.stream)
+                spent += time.perf_counter() - start
+                await asyncio.sleep(args.pause)
+
+        lags = await measure_loop_lag(work, tick=0.005)
+        if stop is not None:
+            stop()
+        sink.close()
+        calls = args.bursts * args.burst
+        print(f"{label:<28} {spent / calls * 1e6:8.1f}us/event on the loop")
+        report("", lags)
+
+    def print_lines(stream):
+        print(f"Heartbeat queued with state 'on' at interval 5.0s", file=stream)
+        print(message, file=stream)
+
+    log = get_logger("bench")
+
+    def log_events(stream):
+        log.info("heartbeat.queued", name="panel-1", state="on", interval=5.0)
+        log.debug("message.received", size=len(message), message=message)
+
+    for sink_name, make_sink in (("file", FileSink), ("slow pipe", lambda: SlowPipe(args.drain_rate))):
+        await run(f"print, {sink_name}", make_sink(), print_lines)
+        sink = make_sink()
+        pipeline = LogPipeline(stream=sink.stream, sample={"heartbeat.queued": 12}).start()
+        await run(f"queued logging, {sink_name}", sink, log_events, pipeline.stop)
+        print(f"dropped at the full queue: {pipeline.handler.dropped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Panel client micro-benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    loop_latency = commands.add_parser("loop-latency", help="event-loop lag while a hardware command hangs")
+    loop_latency.add_argument("--hang", type=float, default=1.0, help="seconds the command hangs before timing out")
+    loop_latency.set_defaults(func=bench_loop_latency)
+
+    telemetry = commands.add_parser("telemetry", help="sysfs reader against the fork-per-read path")
+    telemetry.add_argument("--root", help="thermal root to read, defaults to a generated fake sysfs tree")
+    telemetry.add_argument("--iterations", type=int, default=200)
+    telemetry.set_defaults(func=bench_telemetry)
+
+    gpio_latency = commands.add_parser("gpio-latency", help="edge to sent sensorEvent with simulated GPIO")
+    gpio_latency.add_argument("--edges", type=int, default=100)
+    gpio_latency.add_argument("--debounce", type=float, default=0.05)
+    gpio_latency.set_defaults(func=bench_gpio_latency)
+
+    flood = commands.add_parser("instruction-flood", help="instruction throughput, inline against the dispatcher")
+    flood.add_argument("--instructions", type=int, default=500)
+    flood.add_argument("--duplicates", type=float, default=0.1, help="share of retransmitted instructions")
+    flood.add_argument("--display-delay", type=float, default=0.02, help="simulated xrandr latency in seconds")
+    flood.set_defaults(func=bench_instruction_flood)
+
+    timing = commands.add_parser("heartbeat-timing", help="heartbeat period accuracy, sleep loop against the scheduler")
+    timing.add_argument("--interval", type=float, default=0.1)
+    timing.add_argument("--send-cost", type=float, default=0.01)
+    timing.add_argument("--beats", type=int, default=50)
+    timing.set_defaults(func=bench_heartbeat_timing)
+
+    heartbeat_size = commands.add_parser("heartbeat-size", help="bytes per panel per hour for each heartbeat mode")
+    heartbeat_size.add_argument("--interval", type=float, default=5)
+    heartbeat_size.add_argument("--keyframe-interval", type=int, default=12)
+    heartbeat_size.add_argument("--window-bits", type=int, default=12)
+    heartbeat_size.set_defaults(func=bench_heartbeat_size)
+
+    log_overhead = commands.add_parser("log-overhead", help="loop cost of print against queued structured logging")
+    log_overhead.add_argument("--bursts", type=int, default=200)
+    log_overhead.add_argument("--burst", type=int, default=20, help="events per burst, each a heartbeat line and a raw message")
+    log_overhead.add_argument("--pause", type=float, default=0.005, help="seconds between bursts")
+    log_overhead.add_argument("--drain-rate", type=float, default=64 * 1024, help="bytes per second the slow pipe reader takes")
+    log_overhead.set_defaults(func=bench_log_overhead)
+
+    instrumentation = commands.add_parser("metrics", help="instrumentation cost and exposition with mocked hardware")
+    instrumentation.add_argument("--observations", type=int, default=200000)
+    instrumentation.add_argument("--instructions", type=int, default=100)
+    instrumentation.add_argument("--heartbeats", type=int, default=200)
+    instrumentation.add_argument("--display-delay", type=float, default=0.005, help="simulated xrandr latency in seconds")
+    instrumentation.add_argument("--port", type=int, default=0, help="also scrape the HTTP endpoint on this port")
+    instrumentation.set_defaults(func=bench_metrics)
+
+    startup = commands.add_parser("startup", help="import time and time-to-register of a fresh client on mock hardware")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--port", type=int, default=8790)
+    startup.add_argument("--command-delay", type=float, default=0.15, help="simulated xrandr/xset latency in seconds")
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import os
+import websockets
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from heartbeat import HEARTBEAT_MODES, HeartbeatEncoder
+from logs import get_logger
+from metrics import Metrics, StartupTrace, serve_metrics, watch_loop_lag
+from outbox import PRIORITY_ACK, Outbox, Spool
+from reconnect import ReconnectStats, enable_tcp_keepalive, make_reconnect_policy
+from scheduler import HeartbeatScheduler, phase_for
+
+log = get_logger(__name__)
+
+
+class PanelConnection:
+    """The websocket to the server and everything that lives as long as it.
+
+    Outbox and spool, heartbeat schedule and encoder, socket options,
+    reconnect policy and instrumentation. A lone PanelController builds its
+    own; the panels of a PanelHub are all handed the same one, so their acks
+    and events share one outbox and one heartbeat schedule.
+    """
+
+    def __init__(self, name=None, metrics=None):
+        self.name = name
+        self.metrics = metrics or Metrics()
+        self.panels = []
+        self.startup = StartupTrace()
+        self.display_task = None
+        self.uri = f"{os.getenv('URI')}:{os.getenv('PORT')}"
+        self.client_type = os.getenv('CLIENT_TYPE')
+        fast_interval = os.getenv('HEARTBEAT_FAST_INTERVAL')
+        idle_interval = os.getenv('HEARTBEAT_IDLE_INTERVAL')
+        self.heartbeat_scheduler = HeartbeatScheduler(
+            interval=float(os.getenv('HEARTBEAT_INTERVAL', 5)),  # Server can change it with "heartbeatTimer"
+            phase=phase_for(name),
+            jitter=float(os.getenv('HEARTBEAT_JITTER', 0.25)),
+            fast_interval=float(fast_interval) if fast_interval else None,
+            idle_interval=float(idle_interval) if idle_interval else None,
+            active_hold=float(os.getenv('HEARTBEAT_ACTIVE_HOLD', 30)),
+            is_active=self.is_active)
+        # Modes offered in preference order, the server picks one with "heartbeatMode"
+        self.heartbeat_modes = [mode for mode in os.getenv('HEARTBEAT_MODES', 'json').split(',') if mode in HEARTBEAT_MODES]
+        self.heartbeat_keyframe_interval = int(os.getenv('HEARTBEAT_KEYFRAME_INTERVAL', 12))
+        self.heartbeat_encoder = HeartbeatEncoder()
+        self.compression = os.getenv('WS_COMPRESSION', 'deflate')
+        self.deflate_window_bits = int(os.getenv('WS_DEFLATE_WINDOW_BITS', 12))
+        self.deflate_mem_level = int(os.getenv('WS_DEFLATE_MEM_LEVEL', 5))
+        self.open_timeout = float(os.getenv('WS_OPEN_TIMEOUT', 10))  # TCP connect plus opening handshake
+        self.ping_interval = float(os.getenv('WS_PING_INTERVAL', 20))
+        self.ping_timeout = float(os.getenv('WS_PING_TIMEOUT', 20))
+        self.close_timeout = float(os.getenv('WS_CLOSE_TIMEOUT', 5))
+        self.tcp_keepalive = (int(os.getenv('TCP_KEEPALIVE_IDLE', 30)),
+                              int(os.getenv('TCP_KEEPALIVE_INTERVAL', 10)),
+                              int(os.getenv('TCP_KEEPALIVE_COUNT', 3)))
+        self.reconnect_policy = make_reconnect_policy(
+            os.getenv('RECONNECT_POLICY', 'backoff'),
+            base=float(os.getenv('RECONNECT_BASE', 0.5)),
+            cap=float(os.getenv('RECONNECT_CAP', 60)),
+            delay=float(os.getenv('RECONNECT_DELAY', 5)))
+        self.reconnect_stats = ReconnectStats()
+        # Outages shorter than this keep the screen as it was and skip the full register sequence
+        self.resume_window = float(os.getenv('RESUME_WINDOW', 30))
+        self.stable_connection = 30  # Seconds up before the backoff starts over
+        self.blank_task = None
+        self.registered_once = False  # Nothing to resume or blank before a session has existed
+        self.websocket = None
+        self.spool = Spool(
+            os.getenv('SPOOL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool.jsonl')),
+            max_bytes=int(os.getenv('SPOOL_MAX_BYTES', 1 << 20)),
+            flush_interval=float(os.getenv('SPOOL_FLUSH_INTERVAL', 10)))
+        self.spool_task = None
+        self.outbox = Outbox(self.spool, max_messages=int(os.getenv('OUTBOX_MAX_MESSAGES', 500)),
+                             encode=self.encode_outbound, metrics=self.metrics)
+        # Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics when a port is set
+        metrics_port = os.getenv('METRICS_PORT')
+        self.metrics_port = int(metrics_port) if metrics_port else None
+        self.metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+        self.metrics_server = None
+        self.metrics_in_heartbeat = os.getenv('METRICS_HEARTBEAT', '1') == '1'
+        self.loop_lag_interval = float(os.getenv('LOOP_LAG_INTERVAL', 0.5))
+        self.loop_lag_warn = float(os.getenv('LOOP_LAG_WARN', 0.25))
+        self.watchdog_task = None
+
+    def add_panel(self, panel):
+        self.panels.append(panel)
+
+    def is_active(self):
+        return any(panel.is_active() for panel in self.panels)
+
+    @property
+    def heartbeat_interval(self):
+        return self.heartbeat_scheduler.interval
+
+    @heartbeat_interval.setter
+    def heartbeat_interval(self, interval):
+        self.heartbeat_scheduler.set_interval(interval)
+
+    def can_resume(self):
+        # Only a registered session that dropped less than resume_window ago; blank_after ends the window
+        return self.registered_once and self.blank_task is not None and not self.blank_task.done()
+
+    def websocket_options(self):
+        options = {
+            "open_timeout": self.open_timeout,
+            "ping_interval": self.ping_interval,
+            "ping_timeout": self.ping_timeout,
+            "close_timeout": self.close_timeout,
+            "compression": None,
+        }
+        if self.compression == "deflate":
+            # Smaller windows than the zlib defaults keep per-connection memory low on the Pi
+            # and on servers holding thousands of panels; heartbeats are tiny anyway.
+            options["extensions"] = [ClientPerMessageDeflateFactory(
+                server_max_window_bits=self.deflate_window_bits,
+                client_max_window_bits=self.deflate_window_bits,
+                compress_settings={"memLevel": self.deflate_mem_level},
+            )]
+        return options
+
+    def encode_outbound(self, message):
+        # Heartbeats are encoded when they leave the queue so deltas follow what was actually sent
+        if message.kind == "heartbeat":
+            return self.heartbeat_encoder.encode(message.payload)
+        return json.dumps(message.payload)
+
+    def set_heartbeat_timer(self, value):
+        try:
+            new_interval = float(value)
+        except (TypeError, ValueError):
+            new_interval = 0
+        if new_interval > 0:
+            self.heartbeat_interval = new_interval
+            log.info("heartbeat.interval", interval=new_interval)
+        else:
+            log.warning("heartbeat.interval_invalid", value=value)
+
+    def reset_heartbeat_mode(self):
+        self.heartbeat_encoder = HeartbeatEncoder()  # Plain JSON until the server picks a mode
+
+    def set_heartbeat_mode(self, mode):
+        if mode not in self.heartbeat_modes and mode != "json":
+            log.warning("heartbeat.mode_unsupported", mode=mode, keeping=self.heartbeat_encoder.mode)
+            return
+        if mode != self.heartbeat_encoder.mode:
+            self.heartbeat_encoder = HeartbeatEncoder(mode, self.heartbeat_keyframe_interval)
+            log.info("heartbeat.mode", mode=mode)
+
+    async def start_instrumentation(self):
+        self.metrics.add_collector(self.collect_metrics)
+        self.watchdog_task = asyncio.create_task(
+            watch_loop_lag(self.metrics, self.loop_lag_interval, self.loop_lag_warn))
+        if self.metrics_port:
+            try:
+                self.metrics_server = await serve_metrics(self.metrics, self.metrics_host, self.metrics_port)
+            except OSError as e:
+                log.warning("metrics.unavailable", port=self.metrics_port, error=e)
+
+    def collect_metrics(self):
+        yield "panel_connected", "gauge", {}, int(self.websocket is not None)
+        yield "panel_reconnects_total", "counter", {}, self.reconnect_stats.reconnects
+        yield "panel_last_reconnect_seconds", "gauge", {}, self.reconnect_stats.as_dict()["lastTimeToReconnect"]
+        yield "panel_outbox_sent_total", "counter", {}, self.outbox.sent
+        yield "panel_outbox_dropped_total", "counter", {}, self.outbox.dropped
+        yield "panel_outbox_queued", "gauge", {}, len(self.outbox.queue)
+        yield "panel_spool_dropped_total", "counter", {}, self.spool.dropped
+        for step, seconds in self.startup.as_dict().items():
+            yield "panel_startup_seconds", "gauge", {"step": step}, seconds
+
+    async def sample_rtt(self, websocket):
+        # The keepalive pings already measure the round trip; record each new value
+        latency = 0
+        while self.ping_interval:
+            await asyncio.sleep(self.ping_interval / 2)
+            if websocket.latency and websocket.latency != latency:
+                latency = websocket.latency
+                self.metrics.observe("panel_websocket_rtt_seconds", latency)
+
+    def close(self):
+        self.spool.close()
+
+
+class PanelClient:
+    """Keeps a PanelConnection up on behalf of a panel or a hub of panels.
+
+    Reconnects, registers, runs heartbeats and routes incoming messages.
+    Subclasses supply ``client_name``, ``executor`` and ``start_panel``,
+    ``setup_display``, ``register``, ``route_instruction``,
+    ``send_heartbeat_to_server``, ``turn_off_screen`` and ``panel_metrics``.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.metrics = connection.metrics
+
+    @property
+    def heartbeat_interval(self):
+        return self.connection.heartbeat_interval
+
+    @heartbeat_interval.setter
+    def heartbeat_interval(self, interval):
+        self.connection.heartbeat_interval = interval
+
+    def collect_metrics(self):
+        for command, stats in self.executor.stats.items():
+            labels = {"command": command}
+            yield "panel_command_runs_total", "counter", labels, stats.count
+            yield "panel_command_failures_total", "counter", labels, stats.failures
+            yield "panel_command_timeouts_total", "counter", labels, stats.timeouts
+            yield "panel_command_run_seconds_total", "counter", labels, stats.total_run
+        yield from self.panel_metrics()
+
+    async def start_instrumentation(self):
+        self.metrics.add_collector(self.collect_metrics)
+        await self.connection.start_instrumentation()
+
+    async def connect(self):
+        connection = self.connection
+        connection.startup.mark("connect")
+        self.start_panel()
+        await self.start_instrumentation()
+        connection.spool_task = asyncio.create_task(connection.spool.run())
+        # Blank the screen and apply the X settings while the handshake runs
+        self.start_display_setup()
+        while True:
+            connection.reconnect_stats.attempt()
+            try:
+                async with websockets.connect(connection.uri, **connection.websocket_options()) as websocket:
+                    connection.startup.mark("websocket_open")
+                    enable_tcp_keepalive(websocket, *connection.tcp_keepalive)
+                    resume = connection.can_resume()
+                    if connection.blank_task is not None:
+                        connection.blank_task.cancel()
+                        connection.blank_task = None
+                    gap = connection.reconnect_stats.connected()
+                    if gap is None:
+                        log.info("connection.open", uri=connection.uri)
+                    else:
+                        log.info("connection.open", uri=connection.uri, reconnect_after=gap)
+                    if resume:
+                        await self.register(websocket, resume=True)
+                    else:
+                        if connection.registered_once:
+                            # Past the resume window blank_after has run; redo the X settings in case X restarted
+                            self.start_display_setup()
+                        await self.register(websocket)
+                    connection.registered_once = True
+                    connection.startup.mark("registered")
+                    connection.websocket = websocket
+                    connection.outbox.attach(websocket)
+                    try:
+                        await self.main_loop(websocket)
+                    finally:
+                        connection.websocket = None
+                        await connection.outbox.detach()
+            except websockets.ConnectionClosedError as e:
+                log.warning("connection.closed", error=e)
+            except Exception as e:
+                log.error("connection.error", error=e)
+            self.connection_lost()
+            delay = connection.reconnect_policy.next_delay()
+            log.info("connection.retry", delay=delay)
+            await asyncio.sleep(delay)
+
+    def connection_lost(self):
+        connection = self.connection
+        uptime = connection.reconnect_stats.disconnected()
+        if uptime is not None and uptime > connection.stable_connection:
+            connection.reconnect_policy.reset()
+        if connection.registered_once and connection.blank_task is None:
+            connection.blank_task = asyncio.create_task(self.blank_after(connection.resume_window))
+
+    def start_display_setup(self):
+        # Registration does not wait for this; display instructions do
+        connection = self.connection
+        if connection.display_task is None or connection.display_task.done():
+            connection.display_task = asyncio.create_task(self.setup_display())
+        return connection.display_task
+
+    async def blank_after(self, delay):
+        await asyncio.sleep(delay)
+        await self.turn_off_screen()
+
+    async def main_loop(self, websocket):
+        heartbeat_task = asyncio.create_task(self.send_heartbeat())
+        rtt_task = asyncio.create_task(self.connection.sample_rtt(websocket))
+        try:
+            while True:
+                message = await websocket.recv()
+                await self.handle_message(message, websocket)
+        finally:
+            rtt_task.cancel()
+            heartbeat_task.cancel()
+            await heartbeat_task
+
+    async def handle_message(self, message, websocket):
+        log.debug("message.received", size=len(message), message=message)
+        try:
+            data = json.loads(message)
+            if "heartbeatMode" in data:
+                self.connection.set_heartbeat_mode(data["heartbeatMode"])
+            if "heartbeatTimer" in data:
+                self.connection.set_heartbeat_timer(data["heartbeatTimer"])
+            if data.get("type") == "heartbeatResync":
+                self.connection.heartbeat_encoder.reset()
+                await self.send_heartbeat_to_server()
+            elif data.get("type") == "instruction" and data.get("to") == "panel":
+                instruction = data.get("instruction")
+                instruction_id = data.get("instructionId")
+                log.info("instruction.received", instruction=instruction, id=instruction_id)
+                panel = self.route_instruction(data)
+                if panel is None:
+                    # Tell the server rather than leave it waiting for an ack that never comes
+                    await self.send_acknowledgement(instruction_id, "unknownPanel")
+                elif instruction:
+                    panel.dispatcher.submit(instruction_id, instruction)
+            else:
+                pass
+        except json.JSONDecodeError:
+            log.warning("message.undecodable", message=message)
+
+    async def acknowledge(self, instruction_id, status):
+        await self.send_acknowledgement(instruction_id, status)
+
+    async def send_acknowledgement(self, instruction_id, status):
+        acknowledgement_message = {
+            "type": "acknowledgement",
+            "instructionId": instruction_id,
+            "status": status,
+            "panelName": self.client_name,
+        }
+        # Spooled while offline so the server learns the outcome after reconnecting
+        self.connection.outbox.put(acknowledgement_message, PRIORITY_ACK, spool=True)
+        log.info("ack.queued", id=instruction_id, status=status)
+
+    async def send_heartbeat(self):
+        try:
+            async for _ in self.connection.heartbeat_scheduler.ticks():
+                await self.send_heartbeat_to_server()
+        except asyncio.CancelledError:
+            log.debug("heartbeat.stopped")
+        except Exception as e:
+            log.exception("heartbeat.error", error=e)
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Instructions sharing a resource run one at a time, in order. Those without
+# one (refresh, unknown) run immediately alongside everything else.
+INSTRUCTION_RESOURCES = {
+    "on": "display",
+    "off": "display",
+    "reboot": "power",
+}
+# Resources where only the final queued state matters
+COALESCED_RESOURCES = ("display",)
+
+
+class Instruction:
+    def __init__(self, instruction_id, instruction):
+        self.id = instruction_id
+        self.instruction = instruction
+        self.resource = INSTRUCTION_RESOURCES.get(instruction)
+        self.received_at = time.monotonic()
+
+
+class InstructionDispatcher:
+    """Decouples receiving instructions from executing them.
+
+    ``submit`` never blocks the receive loop. Each resource has its own queue
+    and worker; a burst of display instructions collapses into the last one
+    and the skipped ones are acknowledged as ``superseded``. Statuses of the
+    last ``cache_size`` instruction ids are kept so a retransmitted
+    instruction is acknowledged again without running twice. With
+    ``metrics`` set, queueing, execution and receive-to-ack times are
+    recorded per instruction.
+    """
+
+    def __init__(self, execute, acknowledge, cache_size=256, metrics=None):
+        self.execute = execute
+        self.acknowledge = acknowledge
+        self.cache_size = cache_size
+        self.metrics = metrics
+        self.results = OrderedDict()
+        self.queues = {}
+        self.workers = {}
+        self.in_flight = set()
+        self.tasks = set()
+        self.executed = 0
+        self.superseded = 0
+        self.duplicates = 0
+
+    def submit(self, instruction_id, instruction):
+        if instruction_id is not None:
+            if instruction_id in self.results:
+                self.results.move_to_end(instruction_id)
+                self.duplicates += 1
+                self._spawn(self.acknowledge(instruction_id, self.results[instruction_id]))
+                return
+            if instruction_id in self.in_flight:
+                self.duplicates += 1
+                return
+            self.in_flight.add(instruction_id)
+
+        item = Instruction(instruction_id, instruction)
+        if item.resource is None:
+            self._spawn(self._run(item))
+            return
+
+        queue = self.queues.setdefault(item.resource, deque())
+        if item.resource in COALESCED_RESOURCES:
+            while queue:
+                self._spawn(self._finish(queue.popleft(), "superseded"))
+                self.superseded += 1
+        queue.append(item)
+        worker = self.workers.get(item.resource)
+        if worker is None or worker.done():
+            self.workers[item.resource] = asyncio.create_task(self._work(item.resource))
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _work(self, resource):
+        queue = self.queues[resource]
+        while queue:
+            await self._run(queue.popleft())
+
+    async def _run(self, item):
+        started = time.monotonic()
+        try:
+            status = await self.execute(item.instruction)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("instruction.failed", instruction=item.instruction, id=item.id, error=e)
+            status = "failed"
+        self.executed += 1
+        if self.metrics is not None:
+            self.metrics.observe("panel_instruction_wait_seconds", started - item.received_at, instruction=item.instruction)
+            self.metrics.observe("panel_instruction_execute_seconds", time.monotonic() - started,
+                                 instruction=item.instruction)
+        await self._finish(item, status)
+
+    async def _finish(self, item, status):
+        if item.id is not None:
+            self.in_flight.discard(item.id)
+            self.results[item.id] = status
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+        await self.acknowledge(item.id, status)
+        if self.metrics is not None:
+            self.metrics.observe("panel_instruction_ack_seconds", time.monotonic() - item.received_at,
+                                 instruction=item.instruction)
+
+    async def drain(self):
+        while self.tasks or any(not worker.done() for worker in self.workers.values()):
+            await asyncio.gather(*self.tasks, *self.workers.values(), return_exceptions=True)
+
+    def close(self):
+        for task in (*self.tasks, *self.workers.values()):
+            task.cancel()
+        for queue in self.queues.values():
+            queue.clear()
+        self.in_flight.clear()
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+class DisplayBackend:
+    """Keeps the last known output state in memory.
+
+    ``state`` is updated when our own commands succeed, so heartbeats read it
+    for free. ``watch`` runs in the background and reconciles it with the real
+    display, catching changes made outside the client.
+    """
+
+    def __init__(self, output="HDMI-1", verify_interval=60):
+        self.output = output
+        self.verify_interval = verify_interval
+        self.state = "unknown"
+        self.verified_at = None
+        # Bumped when one of our power commands starts or ends, so a query
+        # racing it cannot overwrite the state we just set
+        self.generation = 0
+
+    async def turn_on(self):
+        return await self._power(True, "on")
+
+    async def turn_off(self):
+        return await self._power(False, "off")
+
+    async def _power(self, on, state):
+        self.generation += 1
+        try:
+            if await self._set_power(on):
+                self.state = state
+                return True
+            return False
+        finally:
+            self.generation += 1
+
+    async def prepare(self):
+        pass
+
+    async def refresh(self):
+        generation = self.generation
+        state = await self.query()
+        if generation != self.generation:
+            # A power command overlapped the query; keep what it left behind
+            return self.state
+        if state == "unknown":
+            # The query itself failed, which says nothing about the screen
+            return self.state
+        if self.state != "unknown" and state != self.state:
+            log.warning("display.changed_outside", output=self.output, previous=self.state, state=state)
+        self.state = state
+        self.verified_at = time.monotonic()
+        return state
+
+    async def watch(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.verify_interval)
+
+    async def _set_power(self, on):
+        raise NotImplementedError
+
+    async def query(self):
+        raise NotImplementedError
+
+
+class XrandrDisplay(DisplayBackend):
+    def __init__(self, executor, output="HDMI-1", verify_interval=60):
+        super().__init__(output, verify_interval)
+        self.executor = executor
+
+    async def _set_power(self, on):
+        result = await self.executor.run("xrandr", "--output", self.output, "--auto" if on else "--off")
+        return result.ok
+
+    async def prepare(self):
+        # Independent settings, no need to wait for one xset before starting the next
+        await asyncio.gather(
+            self.executor.run("xset", "s", "off"),
+            self.executor.run("xset", "s", "noblank"),
+            self.executor.run("xset", "-dpms"),
+        )
+
+    async def query(self):
+        result = await self.executor.run("xrandr", "--listmonitors")
+        if not result.ok:
+            return "unknown"
+        monitors = result.stdout.decode().splitlines()[1:]
+        return "on" if any(line.split()[-1] == self.output for line in monitors if line.strip()) else "off"
+
+    async def watch(self):
+        # Refresh on RandR change events when xev is available, and every
+        # verify_interval regardless in case an event was missed.
+        while True:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "xev", "-root", "-event", "randr",
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    env=self.executor.env,
+                )
+            except OSError:
+                log.info("display.polling", output=self.output, reason="xev not available")
+                await super().watch()
+                return
+            try:
+                await self._follow_events(process)
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+            await asyncio.sleep(self.verify_interval)
+
+    async def _follow_events(self, process):
+        await self.refresh()
+        while True:
+            try:
+                line = await asyncio.wait_for(process.stdout.readline(), self.verify_interval)
+            except asyncio.TimeoutError:
+                await self.refresh()
+                continue
+            if not line:
+                return
+            if line.startswith(b"RRScreenChangeNotify") or line.startswith(b"RRNotify"):
+                await asyncio.sleep(0.2)  # A mode change emits a burst of events
+                await self.refresh()
+
+
+class FakeDisplay(DisplayBackend):
+    """In-memory display for tests; ``set_actual`` simulates a manual change."""
+
+    def __init__(self, output="HDMI-1", verify_interval=60, actual="off", delay=0.0):
+        super().__init__(output, verify_interval)
+        self.actual = actual
+        self.delay = delay
+        self.power_calls = 0
+        self.queries = 0
+
+    def set_actual(self, state):
+        self.actual = state
+
+    async def _set_power(self, on):
+        self.power_calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.actual = "on" if on else "off"
+        return True
+
+    async def query(self):
+        self.queries += 1
+        return self.actual
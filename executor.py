@@ -0,0 +1,154 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+class CommandResult:
+    def __init__(self, args, returncode, stdout=b"", stderr=b"", wait_time=0.0, run_time=0.0, timed_out=False):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.wait_time = wait_time
+        self.run_time = run_time
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def __repr__(self):
+        return (f"CommandResult({' '.join(self.args)!r}, returncode={self.returncode}, "
+                f"run_time={self.run_time:.3f}s, timed_out={self.timed_out})")
+
+
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+        self.last_run = 0.0
+
+    def record(self, result):
+        self.count += 1
+        if not result.ok:
+            self.failures += 1
+        if result.timed_out:
+            self.timeouts += 1
+        self.total_wait += result.wait_time
+        self.total_run += result.run_time
+        self.max_run = max(self.max_run, result.run_time)
+        self.last_run = result.run_time
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "avgWait": self.total_wait / self.count if self.count else 0.0,
+            "avgRun": self.total_run / self.count if self.count else 0.0,
+            "maxRun": self.max_run,
+            "lastRun": self.last_run,
+        }
+
+
+class CommandExecutor:
+    """Runs external commands as asyncio subprocesses so the event loop never blocks.
+
+    Concurrency is bounded by a semaphore, every call has a timeout after which
+    the child is killed, and cancelling the awaiting task kills the child too.
+    Wait and run times are accounted per command name in ``stats``.
+    """
+
+    def __init__(self, timeout=10, max_concurrency=4, display=":0"):
+        self.timeout = timeout
+        self.env = os.environ.copy()
+        self.env["DISPLAY"] = display
+        self.stats = defaultdict(CommandStats)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, *args, timeout=None, name=None):
+        name = name or os.path.basename(args[0])
+        timeout = self.timeout if timeout is None else timeout
+        queued = time.monotonic()
+        async with self._semaphore:
+            started = time.monotonic()
+            result = await self._execute(args, timeout)
+        result.wait_time = started - queued
+        result.run_time = time.monotonic() - started
+        self.stats[name].record(result)
+        if result.timed_out:
+            log.warning("command.timeout", command=name, timeout=timeout)
+        elif not result.ok:
+            log.warning("command.failed", command=name, code=result.returncode, stderr=result.stderr.decode(errors='replace').strip())
+        return result
+
+    async def _execute(self, args, timeout):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=self.env,
+            )
+        except OSError as e:
+            return CommandResult(args, 127, stderr=str(e).encode())
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            self._kill(process)
+            await process.wait()
+            return CommandResult(args, process.returncode, timed_out=True)
+        except asyncio.CancelledError:
+            self._kill(process)
+            raise
+        return CommandResult(args, process.returncode, stdout, stderr)
+
+    @staticmethod
+    def _kill(process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+class StubCommand:
+    def __init__(self, stdout=b"", returncode=0, delay=0.0, hang=False):
+        self.stdout = stdout
+        self.returncode = returncode
+        self.delay = delay
+        self.hang = hang
+
+
+class StubExecutor(CommandExecutor):
+    """Executor for tests and benchmarks that never spawns processes.
+
+    ``commands`` maps a program name (``"xrandr"``, ``"xset"``...) to a
+    ``StubCommand``. Unknown programs succeed immediately. Every call is
+    recorded in ``calls`` so callers can assert what would have been run.
+    """
+
+    def __init__(self, commands=None, **kwargs):
+        super().__init__(**kwargs)
+        self.commands = commands or {}
+        self.calls = []
+
+    async def _execute(self, args, timeout):
+        self.calls.append(args)
+        stub = self.commands.get(os.path.basename(args[0]), StubCommand())
+        try:
+            if stub.hang:
+                await asyncio.wait_for(asyncio.Event().wait(), timeout)
+            elif stub.delay:
+                await asyncio.wait_for(asyncio.sleep(stub.delay), timeout)
+        except asyncio.TimeoutError:
+            return CommandResult(args, None, timed_out=True)
+        return CommandResult(args, stub.returncode, stub.stdout)
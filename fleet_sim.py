@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import psutil
+import websockets
+
+from connection import PanelConnection
+from display import FakeDisplay
+from executor import StubExecutor
+from gpio_handler import SimulatedGPIO
+from panel_controller import PanelController
+from panel_hub import PanelHub
+from standin_server import StandInServer
+from telemetry import SimulatedTelemetry
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def make_connection(uri, name, args, spool_dir):
+    connection = PanelConnection(name)
+    connection.uri = uri
+    connection.client_type = "panel"
+    connection.heartbeat_interval = args.heartbeat_interval
+    connection.heartbeat_modes = [args.heartbeat_mode]
+    connection.heartbeat_scheduler.jitter = args.heartbeat_jitter
+    connection.spool.path = os.path.join(spool_dir, f"{name}.jsonl")
+    return connection
+
+
+def make_panel(uri, name, args, spool_dir):
+    return PanelController(
+        executor=StubExecutor(),
+        display=FakeDisplay(delay=args.display_delay),
+        gpio=SimulatedGPIO(),
+        telemetry=SimulatedTelemetry(),
+        name=name,
+        connection=make_connection(uri, name, args, spool_dir),
+    )
+
+
+def make_hub(uri, names, args, spool_dir):
+    executor = StubExecutor()
+    gpio = SimulatedGPIO()
+    telemetry = SimulatedTelemetry()
+    connection = make_connection(uri, names[0], args, spool_dir)
+    panels = [
+        PanelController(executor=executor, display=FakeDisplay(f"HDMI-{index + 1}", delay=args.display_delay),
+                        gpio=gpio, telemetry=telemetry, name=name, output=f"HDMI-{index + 1}", connection=connection)
+        for index, name in enumerate(names)
+    ]
+    return PanelHub(panels, executor)
+
+
+async def run_panels(uri, names, args):
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    cpu_before = process.cpu_times()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            tempfile.TemporaryDirectory(prefix="fleet-spool-") as spool_dir:
+        if args.panels_per_connection > 1:
+            size = args.panels_per_connection
+            controllers = [make_hub(uri, names[index:index + size], args, spool_dir)
+                           for index in range(0, len(names), size)]
+        else:
+            controllers = [make_panel(uri, name, args, spool_dir) for name in names]
+        tasks = [asyncio.create_task(controller.connect()) for controller in controllers]
+        await asyncio.sleep(args.storm_timeout + args.duration)
+        rss_after = process.memory_info().rss
+        cpu_after = process.cpu_times()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "panels": len(names),
+        "cpu": (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system),
+        "rss": rss_after - rss_before,
+    }
+
+
+def worker(uri, names, args, results):
+    raise_fd_limit()
+    results.put(asyncio.run(run_panels(uri, names, args)))
+
+
+async def wait_for_storm(server, started, args):
+    try:
+        await asyncio.wait_for(server.all_registered.wait(), args.storm_timeout)
+        return time.monotonic() - started
+    except asyncio.TimeoutError:
+        return None
+
+
+async def main(args):
+    raise_fd_limit()
+    uri = f"ws://127.0.0.1:{args.port}"
+    names = [f"sim-{index:05d}" for index in range(args.panels)]
+    server = StandInServer(args.instruction_rate, heartbeat_mode=args.heartbeat_mode, seed=1)
+    server.expected_panels = args.panels
+    loop = asyncio.get_running_loop()
+
+    async with websockets.serve(server.handler, "127.0.0.1", args.port, max_size=2**20):
+        started = time.monotonic()
+        if args.workers:
+            results = multiprocessing.get_context("spawn").Queue()
+            processes = [
+                multiprocessing.get_context("spawn").Process(
+                    target=worker, args=(uri, names[index::args.workers], args, results))
+                for index in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            panels_done = asyncio.gather(*(loop.run_in_executor(None, process.join) for process in processes))
+        else:
+            panels_done = asyncio.create_task(run_panels(uri, names, args))
+
+        storm_time = await wait_for_storm(server, started, args)
+        instruction_task = asyncio.create_task(server.send_instructions())
+        await panels_done
+        instruction_task.cancel()
+
+        if args.workers:
+            client_stats = [results.get() for _ in processes]
+        else:
+            client_stats = [panels_done.result()]
+
+    panels = sum(stats["panels"] for stats in client_stats)
+    report = {
+        "panels": args.panels,
+        "workers": args.workers,
+        "panelsPerConnection": args.panels_per_connection,
+        "heartbeatMode": args.heartbeat_mode,
+        "connectStormSeconds": storm_time,
+        "registered": len(server.registered_at),
+        **server.summary(args.heartbeat_interval),
+        "cpuSecondsPerClient": sum(stats["cpu"] for stats in client_stats) / panels,
+        "rssBytesPerClient": sum(stats["rss"] for stats in client_stats) / panels,
+    }
+    if not args.workers:
+        report["note"] = "in-process run, client CPU includes the stand-in server"
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many simulated panels against a local stand-in server")
+    parser.add_argument("--panels", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 runs the panels in this process")
+    parser.add_argument("--panels-per-connection", type=int, default=1,
+                        help="panels multiplexed over one connection, batches heartbeats as JSON")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run after the connect storm")
+    parser.add_argument("--storm-timeout", type=float, default=30, help="seconds allowed for every panel to register")
+    parser.add_argument("--instruction-rate", type=float, default=10, help="instructions per second across the fleet")
+    parser.add_argument("--heartbeat-interval", type=float, default=5)
+    parser.add_argument("--heartbeat-jitter", type=float, default=0.0, help="deliberate per-beat jitter in seconds")
+    parser.add_argument("--heartbeat-mode", default="json")
+    parser.add_argument("--display-delay", type=float, default=0.0, help="simulated xrandr latency in seconds")
+    asyncio.run(main(parser.parse_args()))
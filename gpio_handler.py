@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+class SensorEvent:
+    def __init__(self, sensor, value, detected_at):
+        self.sensor = sensor
+        self.value = value
+        self.detected_at = detected_at  # time.monotonic() of the edge
+
+
+class GPIOHandler:
+    """Edge-triggered sensor inputs with a cached snapshot.
+
+    Edges arrive on the RPi.GPIO callback thread and are handed to the event
+    loop. After ``debounce`` seconds the pin is read once more; if the settled
+    value differs from the snapshot the snapshot is updated and a
+    ``SensorEvent`` is queued for ``stream``.
+    """
+
+    def __init__(self, gpio=None, loop=None, door_sensor_pin=17, sector_status_pin=27, button_pin=4,
+                 led1_pin=22, led2_pin=10, debounce=0.05, resync_interval=60):
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.loop = loop
+        self.debounce = debounce
+        self.resync_interval = resync_interval
+
+        self.door_sensor_pin = door_sensor_pin
+        self.sector_status_pin = sector_status_pin
+        self.button_pin = button_pin
+        self.led1_pin = led1_pin
+        self.led2_pin = led2_pin
+
+        # Heartbeat field -> (pin, level meaning True)
+        self.sensors = {
+            "sectorStatus": (self.sector_status_pin, gpio.LOW),
+            "isDoorOpen": (self.door_sensor_pin, gpio.HIGH),
+            "maintenanceMode": (self.button_pin, gpio.HIGH),
+        }
+        self.channels = {pin: sensor for sensor, (pin, _) in self.sensors.items()}
+
+        gpio.setwarnings(False)
+        gpio.setmode(gpio.BCM)
+        gpio.setup(self.door_sensor_pin, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+        gpio.setup(self.sector_status_pin, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+        gpio.setup(self.button_pin, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+        gpio.setup(self.led1_pin, gpio.OUT)
+        gpio.setup(self.led2_pin, gpio.OUT)
+
+        self.snapshot = {sensor: self.read(sensor) for sensor in self.sensors}
+        self.events = asyncio.Queue()
+        self._settling = {}
+
+        # No hardware bouncetime: RPi.GPIO would swallow the edges that follow
+        # the first one, and the settle read would miss a quick second change
+        for pin in self.channels:
+            gpio.add_event_detect(pin, gpio.BOTH, callback=self.gpio_event_detected)
+
+        log.info("gpio.initialized", pins=",".join(str(pin) for pin in sorted(self.channels)))
+
+    def attach(self, loop):
+        self.loop = loop
+        self.resync()
+
+    def read(self, sensor):
+        pin, active = self.sensors[sensor]
+        return self.gpio.input(pin) == active
+
+    def gpio_event_detected(self, channel):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.handle_gpio_event, channel, time.monotonic())
+
+    def handle_gpio_event(self, channel, detected_at):
+        sensor = self.channels.get(channel)
+        if sensor is None or channel in self._settling:
+            return
+        self._settling[channel] = self.loop.call_later(self.debounce, self._settle, channel, sensor, detected_at)
+
+    def _settle(self, channel, sensor, detected_at):
+        del self._settling[channel]
+        self._update(sensor, self.read(sensor), detected_at)
+
+    def _update(self, sensor, value, detected_at):
+        if self.snapshot[sensor] != value:
+            self.snapshot[sensor] = value
+            self.events.put_nowait(SensorEvent(sensor, value, detected_at))
+
+    def resync(self):
+        # Safety net for edges lost while the loop was busy or not yet attached
+        now = time.monotonic()
+        for sensor in self.sensors:
+            self._update(sensor, self.read(sensor), now)
+
+    async def stream(self):
+        while True:
+            try:
+                yield await asyncio.wait_for(self.events.get(), self.resync_interval)
+            except asyncio.TimeoutError:
+                self.resync()
+
+    def set_leds(self, led1_status, led2_status):
+        self.gpio.output(self.led1_pin, self.gpio.HIGH if led1_status else self.gpio.LOW)
+        self.gpio.output(self.led2_pin, self.gpio.HIGH if led2_status else self.gpio.LOW)
+
+    def cleanup(self):
+        for handle in self._settling.values():
+            handle.cancel()
+        self._settling.clear()
+        self.gpio.cleanup()
+        log.info("gpio.cleanup")
+
+
+class SimulatedGPIO:
+    """Stand-in for the RPi.GPIO module.
+
+    ``set_input`` changes a pin level and fires edge callbacks from a separate
+    thread, the way the real library does.
+    """
+
+    BCM = 11
+    IN = 1
+    OUT = 0
+    PUD_DOWN = 21
+    PUD_UP = 22
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, levels=None):
+        self.levels = dict(levels or {})
+        self.callbacks = {}
+        self._lock = threading.Lock()
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        with self._lock:
+            self.levels.setdefault(pin, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+
+    def input(self, pin):
+        with self._lock:
+            return self.levels[pin]
+
+    def output(self, pin, level):
+        with self._lock:
+            self.levels[pin] = level
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def set_input(self, pin, level):
+        with self._lock:
+            changed = self.levels.get(pin) != level
+            self.levels[pin] = level
+        callback = self.callbacks.get(pin)
+        if changed and callback is not None:
+            threading.Thread(target=callback, args=(pin,), daemon=True).start()
+
+    def cleanup(self):
+        self.callbacks.clear()
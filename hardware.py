@@ -0,0 +1,98 @@
+import importlib
+import os
+from display import DisplayBackend, XrandrDisplay
+from executor import CommandExecutor, CommandResult, StubCommand, StubExecutor
+
+
+class PiHardware:
+    """xrandr/xset through real processes and RPi.GPIO, imported on first use."""
+
+    def executor(self, timeout):
+        return CommandExecutor(timeout=timeout)
+
+    def display(self, executor, output, verify_interval):
+        return XrandrDisplay(executor, output, verify_interval=verify_interval)
+
+    def gpio(self):
+        import RPi.GPIO as gpio
+        return gpio
+
+
+class PollingXrandrDisplay(XrandrDisplay):
+    async def watch(self):
+        # No X server to take RandR events from
+        await DisplayBackend.watch(self)
+
+
+class MockXrandrExecutor(StubExecutor):
+    """StubExecutor whose xrandr remembers which outputs it switched on.
+
+    ``--listmonitors`` reports what the last ``--auto`` or ``--off`` per
+    output left behind, as FakeDisplay does, so polling agrees with the
+    commands that were run.
+    """
+
+    def __init__(self, commands=None, **kwargs):
+        super().__init__(commands, **kwargs)
+        self.monitors = []
+
+    async def _execute(self, args, timeout):
+        result = await super()._execute(args, timeout)
+        if os.path.basename(args[0]) != "xrandr" or not result.ok:
+            return result
+        if "--listmonitors" in args:
+            lines = [f"Monitors: {len(self.monitors)}"]
+            lines += [f" {index}: +{output} 1920/509x1080/286+0+0  {output}"
+                      for index, output in enumerate(self.monitors)]
+            return CommandResult(args, result.returncode, ("\n".join(lines) + "\n").encode())
+        if "--output" in args:
+            output = args[args.index("--output") + 1]
+            if output in self.monitors:
+                self.monitors.remove(output)
+            if "--auto" in args:
+                self.monitors.append(output)
+        return result
+
+
+class MockHardware:
+    """Runs the real command sequences against stubs, for development and benchmarks.
+
+    Every stubbed program, ``sudo reboot`` included, takes ``command_delay``
+    seconds and succeeds without spawning anything.
+    """
+
+    def __init__(self, command_delay=0.0):
+        self.command_delay = command_delay
+
+    def executor(self, timeout):
+        command = StubCommand(delay=self.command_delay)
+        return MockXrandrExecutor({
+            "xrandr": command,
+            "xset": command,
+            "sudo": command,
+        }, timeout=timeout)
+
+    def display(self, executor, output, verify_interval):
+        return PollingXrandrDisplay(executor, output, verify_interval=verify_interval)
+
+    def gpio(self):
+        from gpio_handler import SimulatedGPIO
+        return SimulatedGPIO()
+
+
+HARDWARE_BACKENDS = {
+    "pi": PiHardware,
+    "mock": lambda: MockHardware(float(os.getenv('MOCK_COMMAND_DELAY', 0))),
+}
+
+
+def load_hardware(name=None):
+    # HARDWARE=pi, mock, or module:attribute naming a callable that returns a backend
+    name = name or os.getenv('HARDWARE', 'pi')
+    factory = HARDWARE_BACKENDS.get(name)
+    if factory is None:
+        if ":" not in name:
+            raise ValueError(f"Unknown hardware backend {name}")
+        module, _, attribute = name.partition(":")
+        factory = getattr(importlib.import_module(module), attribute)
+    return factory()
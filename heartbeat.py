@@ -0,0 +1,198 @@
+import json
+import struct
+
+HEARTBEAT_MODES = ("delta", "binary", "json")
+
+# Binary frame layout, all integers big endian:
+#   header  version:u8 flags:u8 seq:u16
+#   fields  id:u8 tag:u8 value, repeated until the end of the frame
+# Unknown keys use FIELD_EXTRA followed by a u16 length prefixed utf-8 key.
+# Strings are u16 length prefixed too; floats are f32, or f64 beyond its range
+# and for integers outside i32.
+BINARY_VERSION = 2
+FLAG_KEYFRAME = 0x01
+
+FIELDS = ("type", "name", "state", "cpuTemp", "sectorStatus", "isDoorOpen", "maintenanceMode",
+          "cpuLoad", "memoryUsage", "diskUsage", "uptime")
+FIELD_IDS = {name: index for index, name in enumerate(FIELDS)}
+FIELD_EXTRA = 0xFF
+
+# Fields that move a little on every beat. A delta carries one only once it has
+# drifted this far from the value last sent; None leaves it to the keyframes.
+VOLATILE_FIELDS = {
+    "uptime": None, "cpuLoad": 10, "memoryUsage": 2, "diskUsage": 1,
+    "loopLagP99": 20, "loopLagMax": 50, "rttP50": 20, "ackP99": 50, "screenP99": 50, "heartbeatSendP99": 20,
+}
+
+TAG_NONE, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_DOUBLE = range(7)
+FLOAT32_MAX = 3.4028234663852886e38
+
+
+def _pack_string(value):
+    raw = value.encode()
+    return struct.pack(">H", len(raw)) + raw
+
+
+def _pack_value(value):
+    if value is None:
+        return bytes((TAG_NONE,))
+    if value is True:
+        return bytes((TAG_TRUE,))
+    if value is False:
+        return bytes((TAG_FALSE,))
+    if isinstance(value, int) and -2**31 <= value < 2**31:
+        return struct.pack(">Bi", TAG_INT, value)
+    if isinstance(value, float) and (abs(value) <= FLOAT32_MAX or value != value):
+        return struct.pack(">Bf", TAG_FLOAT, value)
+    if isinstance(value, (int, float)):
+        return struct.pack(">Bd", TAG_DOUBLE, value)
+    return bytes((TAG_STR,)) + _pack_string(str(value))
+
+
+def encode_binary(fields, seq, keyframe):
+    frame = bytearray(struct.pack(">BBH", BINARY_VERSION, FLAG_KEYFRAME if keyframe else 0, seq & 0xFFFF))
+    for key, value in fields.items():
+        field_id = FIELD_IDS.get(key)
+        if field_id is None:
+            frame += bytes((FIELD_EXTRA,)) + _pack_string(key)
+        else:
+            frame.append(field_id)
+        frame += _pack_value(value)
+    return bytes(frame)
+
+
+def decode_binary(frame):
+    version, flags, seq = struct.unpack_from(">BBH", frame)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported heartbeat frame version {version}")
+    offset = 4
+    fields = {}
+    while offset < len(frame):
+        field_id = frame[offset]
+        offset += 1
+        if field_id == FIELD_EXTRA:
+            length, = struct.unpack_from(">H", frame, offset)
+            key = frame[offset + 2:offset + 2 + length].decode()
+            offset += 2 + length
+        else:
+            key = FIELDS[field_id]
+        tag = frame[offset]
+        offset += 1
+        if tag == TAG_NONE:
+            value = None
+        elif tag in (TAG_FALSE, TAG_TRUE):
+            value = tag == TAG_TRUE
+        elif tag == TAG_INT:
+            value, = struct.unpack_from(">i", frame, offset)
+            offset += 4
+        elif tag == TAG_FLOAT:
+            value, = struct.unpack_from(">f", frame, offset)
+            value = round(value, 2)
+            offset += 4
+        elif tag == TAG_DOUBLE:
+            value, = struct.unpack_from(">d", frame, offset)
+            offset += 8
+        elif tag == TAG_STR:
+            length, = struct.unpack_from(">H", frame, offset)
+            value = frame[offset + 2:offset + 2 + length].decode()
+            offset += 2 + length
+        else:
+            raise ValueError(f"Unknown value tag {tag}")
+        fields[key] = value
+    return seq, bool(flags & FLAG_KEYFRAME), fields
+
+
+class HeartbeatEncoder:
+    """Turns heartbeat dicts into wire frames for the negotiated mode.
+
+    ``json`` sends every field every time. ``delta`` and ``binary`` send a
+    full keyframe every ``keyframe_interval`` heartbeats and only the changed
+    fields in between, leaving out small moves of ``VOLATILE_FIELDS``;
+    ``reset`` forces the next frame to be a keyframe.
+    """
+
+    def __init__(self, mode="json", keyframe_interval=12):
+        if mode not in HEARTBEAT_MODES:
+            raise ValueError(f"Unknown heartbeat mode {mode}")
+        self.mode = mode
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.last = None  # What the decoder holds after the last frame
+        self.since_keyframe = 0
+
+    def reset(self):
+        self.last = None
+
+    def changed(self, key, value):
+        if key not in self.last:
+            return True
+        last = self.last[key]
+        if last == value:
+            return False
+        if key not in VOLATILE_FIELDS:
+            return True
+        threshold = VOLATILE_FIELDS[key]
+        if threshold is None:
+            return False
+        try:
+            return abs(value - last) >= threshold
+        except TypeError:
+            return True
+
+    def encode(self, data):
+        if self.mode == "json":
+            return json.dumps(data)
+
+        self.seq = (self.seq + 1) & 0xFFFF
+        keyframe = self.last is None or self.since_keyframe >= self.keyframe_interval
+        if keyframe:
+            fields = dict(data)
+            self.since_keyframe = 0
+        else:
+            fields = {key: value for key, value in data.items() if self.changed(key, value)}
+            self.since_keyframe += 1
+        self.last = dict(data) if keyframe else {**self.last, **fields}
+
+        if self.mode == "binary":
+            if not keyframe and "name" in data:
+                fields = {"name": data["name"], **fields}  # Lets a server route deltas on a shared connection
+            try:
+                return encode_binary(fields, self.seq, keyframe)
+            except (struct.error, OverflowError):
+                # A value the frame cannot carry (a 64 KiB string, an int past
+                # f64); this one goes out as a JSON keyframe instead
+                self.since_keyframe = 0
+                self.last = dict(data)
+                return json.dumps({**data, "seq": self.seq})
+        if keyframe:
+            return json.dumps({**fields, "seq": self.seq})
+        return json.dumps({"type": "heartbeatDelta", "name": data.get("name"), "seq": self.seq, "changes": fields},
+                          separators=(",", ":"))
+
+
+class HeartbeatDecoder:
+    """Server-side counterpart of HeartbeatEncoder, used by tools and benchmarks.
+
+    Returns the full heartbeat after each frame, or None when a delta arrives
+    without a keyframe to apply it to (the server should then ask for a
+    ``heartbeatResync``).
+    """
+
+    def __init__(self):
+        self.state = None
+
+    def decode(self, frame):
+        if isinstance(frame, (bytes, bytearray)):
+            _, keyframe, fields = decode_binary(frame)
+        else:
+            message = json.loads(frame)
+            keyframe = message.get("type") != "heartbeatDelta"
+            fields = message if keyframe else message["changes"]
+            fields.pop("seq", None)
+        if keyframe:
+            self.state = dict(fields)
+        elif self.state is None:
+            return None
+        else:
+            self.state.update(fields)
+        return dict(self.state)
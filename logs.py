@@ -0,0 +1,253 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dotenv import load_dotenv
+
+
+class EventLogger:
+    """Key/value logging: ``log.info("heartbeat.queued", state="on")``.
+
+    The event name is the record message and the keyword arguments travel
+    as ``record.fields``; nothing is formatted on the calling thread.
+    """
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def log(self, level, event, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+
+def get_logger(name):
+    return EventLogger(name)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    text = str(value)
+    if not text or any(c in text for c in ' ="\n'):
+        return json.dumps(text)
+    return text
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        created = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        fields = getattr(record, "fields", None)
+        if fields is None:
+            # Records from other libraries keep their own message
+            line = f"{created}.{int(record.msecs):03d} {record.levelname} {record.name} {format_value(record.getMessage())}"
+        else:
+            line = f"{created}.{int(record.msecs):03d} {record.levelname} {record.name} {record.msg}"
+            if fields:
+                line += " " + " ".join(f"{key}={format_value(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops repetitive records below WARNING before they are queued.
+
+    Events listed in ``sample`` keep one record in N. Every event also has a
+    token bucket of ``burst`` records refilled at ``rate`` per second. The
+    next record that gets through carries ``suppressed=<count>``.
+    """
+
+    def __init__(self, rate=5.0, burst=20, sample=None, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = dict(sample or {})
+        self.clock = clock
+        self.buckets = {}
+        self.seen = Counter()
+        self.suppressed = Counter()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        event = record.msg
+        every = self.sample.get(event)
+        if every and every > 1:
+            self.seen[event] += 1
+            if (self.seen[event] - 1) % every:
+                self.suppressed[event] += 1
+                return False
+        if self.rate:
+            now = self.clock()
+            tokens, last = self.buckets.get(event, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[event] = (tokens, now)
+                self.suppressed[event] += 1
+                return False
+            self.buckets[event] = (tokens - 1, now)
+        suppressed = self.suppressed.pop(event, 0)
+        if suppressed and getattr(record, "fields", None) is not None:
+            record.fields = {**record.fields, "suppressed": suppressed}
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records without blocking; when the queue is full they are
+    dropped and counted, and the next record queued carries ``dropped=<count>``.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self.unreported = 0
+
+    def enqueue(self, record):
+        if self.unreported and getattr(record, "fields", None) is not None:
+            record.fields = {**record.fields, "dropped": self.unreported}
+            reported = self.unreported
+        else:
+            reported = 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.unreported += 1
+        else:
+            self.unreported -= reported
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; only foreign records with
+        # %-style arguments are rendered here so later mutation cannot change them
+        if record.args:
+            return super().prepare(record)
+        return record
+
+
+class BlockingStopListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room so stop() cannot lose the sentinel on a full queue
+        self.queue.put(self._sentinel)
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last ``capacity`` records, unfiltered, for ``dump``."""
+
+    def __init__(self, capacity=1000, level=logging.DEBUG):
+        super().__init__(level)
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def dump(self, stream):
+        formatter = self.formatter or KeyValueFormatter()
+        for record in list(self.records):
+            stream.write(formatter.format(record) + "\n")
+        stream.flush()
+
+
+class LogPipeline:
+    """Queue-backed logging for the client.
+
+    Callers only append to a queue; a listener thread formats records and
+    writes them to stdout or a size-bounded rotating file. The queue holds
+    at most ``queue_size`` records; beyond that they are dropped rather than
+    grow memory while the output is stuck. A ring buffer of
+    recent records, including the ones rate-limited away, is written to
+    ``dump_path`` on ``dump`` or SIGUSR1.
+    """
+
+    def __init__(self, level=logging.INFO, path=None, max_bytes=1 << 20, backups=3, ring_size=1000,
+                 ring_level=logging.DEBUG, rate=5.0, burst=20, sample=None, dump_path=None, stream=None,
+                 queue_size=10000):
+        formatter = KeyValueFormatter()
+        if path:
+            output = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        else:
+            output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(formatter)
+        self.queue = queue.Queue(queue_size)
+        self.handler = DeferredQueueHandler(self.queue)
+        self.handler.setLevel(level)
+        self.limiter = RateLimitFilter(rate, burst, sample)
+        self.handler.addFilter(self.limiter)
+        self.listener = BlockingStopListener(self.queue, output)
+        self.ring = RingBufferHandler(ring_size, ring_level)
+        self.ring.setFormatter(formatter)
+        self.level = min(level, ring_level)
+        self.dump_path = dump_path
+
+    def start(self):
+        root = logging.getLogger()
+        root.setLevel(self.level)
+        root.addHandler(self.handler)
+        root.addHandler(self.ring)
+        # The websockets library logs every frame at DEBUG
+        logging.getLogger("websockets").setLevel(max(self.level, logging.INFO))
+        self.listener.start()
+        if self.dump_path and hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.dump())
+        return self
+
+    def dump(self, path=None):
+        # Written from a thread so a signal arriving mid-heartbeat does not stall the loop
+        path = path or self.dump_path
+
+        def write():
+            with open(path, "w") as f:
+                self.ring.dump(f)
+
+        thread = threading.Thread(target=write, name="log-dump", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        root.removeHandler(self.ring)
+        self.listener.stop()
+        self.listener.handlers[0].close()
+
+
+def setup_logging():
+    load_dotenv()
+    # LOG_SAMPLE=heartbeat.queued:12,message.received:10 keeps one record in N for those events
+    sample = {}
+    for item in filter(None, os.getenv('LOG_SAMPLE', 'heartbeat.queued:12').split(',')):
+        event, _, every = item.partition(':')
+        sample[event.strip()] = int(every or 1)
+    return LogPipeline(
+        level=logging.getLevelName(os.getenv('LOG_LEVEL', 'INFO').upper()),
+        path=os.getenv('LOG_FILE'),
+        max_bytes=int(os.getenv('LOG_MAX_BYTES', 1 << 20)),
+        backups=int(os.getenv('LOG_BACKUPS', 3)),
+        ring_size=int(os.getenv('LOG_RING_SIZE', 1000)),
+        ring_level=logging.getLevelName(os.getenv('LOG_RING_LEVEL', 'DEBUG').upper()),
+        rate=float(os.getenv('LOG_RATE', 5)),
+        burst=int(os.getenv('LOG_BURST', 20)),
+        sample=sample,
+        queue_size=int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+        dump_path=os.getenv('LOG_DUMP_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log-dump.txt')),
+    ).start()
@@ -0,0 +1,197 @@
+import asyncio
+import bisect
+import time
+
+import psutil
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+# Seconds; hardware commands and loop stalls both fall inside this range
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``observe`` is a bisect and three additions."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket, as Prometheus' histogram_quantile does
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+def format_label_value(value):
+    # The exposition format escapes backslash, double quote and newline in label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{format_label_value(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """Histograms plus collectors, rendered in the Prometheus text format.
+
+    Histograms are keyed by name and label values. Collectors are callables
+    yielding ``(name, type, labels, value)`` when rendered, for counters that
+    already live elsewhere such as executor and reconnect statistics.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.collectors = []
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def merged(self, name, **allowed):
+        # Sums every label set of ``name`` whose labels take one of the ``allowed`` values
+        total = Histogram(self.buckets)
+        for (histogram_name, labels), histogram in self.histograms.items():
+            if histogram_name == name and all(dict(labels).get(key) in values for key, values in allowed.items()):
+                total.merge(histogram)
+        return total
+
+    def add_collector(self, collector):
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        names = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in names:
+                names.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels((*labels, ('le', bound)))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        families = {}
+        for collector in self.collectors:
+            for name, kind, labels, value in collector():
+                if value is not None:
+                    families.setdefault(name, (kind, []))[1].append((labels, value))
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(sorted(labels.items()))} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # Flat millisecond fields so every heartbeat mode carries them and deltas stay small
+        fields = {}
+        for key, name, allowed, q in (
+                ("loopLagP99", "panel_loop_lag_seconds", {}, 0.99),
+                ("loopLagMax", "panel_loop_lag_seconds", {}, None),
+                ("rttP50", "panel_websocket_rtt_seconds", {}, 0.5),
+                ("ackP99", "panel_instruction_ack_seconds", {}, 0.99),
+                ("screenP99", "panel_screen_command_seconds", {}, 0.99),
+                ("heartbeatSendP99", "panel_outbox_send_seconds", {"kind": ("heartbeat", "heartbeatBatch")}, 0.99)):
+            histogram = self.merged(name, **allowed)
+            if histogram.count:
+                value = histogram.max if q is None else histogram.quantile(q)
+                fields[key] = round(value * 1000)
+        return fields
+
+
+class StartupTrace:
+    """Seconds from process start to each boot milestone, logged as reached.
+
+    The origin is the process creation time, so interpreter start-up and
+    imports are included. Only the first ``mark`` of a step counts.
+    """
+
+    def __init__(self, origin=None, clock=time.monotonic):
+        self.clock = clock
+        if origin is None:
+            origin = clock() - max(0.0, time.time() - psutil.Process().create_time())
+        self.origin = origin
+        self.steps = {}
+
+    def mark(self, step):
+        if step not in self.steps:
+            self.steps[step] = self.clock() - self.origin
+            log.info("startup.step", step=step, seconds=self.steps[step])
+
+    def as_dict(self):
+        return dict(self.steps)
+
+
+async def watch_loop_lag(metrics, interval=0.5, warn=0.25):
+    # Watchdog: a sleep that wakes late means something held the loop
+    histogram = metrics.histogram("panel_loop_lag_seconds")
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        histogram.observe(lag)
+        if lag > warn:
+            log.warning("loop.lag", seconds=lag)
+
+
+async def serve_metrics(metrics, host="127.0.0.1", port=9101):
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            parts = request.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                status, body = "200 OK", metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    log.info("metrics.listening", host=host, port=port)
+    return server
@@ -0,0 +1,336 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import deque
+
+import websockets
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+PRIORITY_ACK = 0
+PRIORITY_EVENT = 1
+PRIORITY_REPLAY = 2
+PRIORITY_HEARTBEAT = 3
+
+
+class OutboundMessage:
+    def __init__(self, payload, priority, kind=None, coalesce_key=None, spool=False):
+        self.payload = payload
+        self.priority = priority
+        self.kind = kind or payload.get("type")
+        self.coalesce_key = coalesce_key
+        self.spool = spool
+        self.queued_at = time.monotonic()
+
+
+class Spool:
+    """Append-only JSON-lines file for messages produced while disconnected.
+
+    Records are buffered in memory and written with a single write and fsync
+    every ``flush_interval`` seconds or ``flush_records`` records, so an SD
+    card sees one sync per batch rather than one per message. When the file
+    grows past ``max_bytes`` the oldest half is dropped.
+
+    ``take`` moves the records to a ``.replay`` file next to the spool, which
+    stays until ``done`` reports them sent, so a crash during replay loses
+    nothing and the next ``take``, after a restart too, starts with them.
+    """
+
+    def __init__(self, path, max_bytes=1 << 20, flush_interval=10.0, flush_records=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.buffer = []
+        self.dropped = 0
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+
+    def append(self, payload):
+        self.buffer.append(json.dumps(payload) + "\n")
+        if len(self.buffer) >= self.flush_records and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._lock:
+            lines, self.buffer = self.buffer, []
+            if lines:
+                await asyncio.to_thread(self._write, lines)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    @property
+    def replay_path(self):
+        return self.path + ".replay"
+
+    async def take(self):
+        # Returns every spooled record, oldest first, and empties the spool into the replay file
+        async with self._lock:
+            lines, self.buffer = self.buffer, []
+            take = asyncio.ensure_future(asyncio.to_thread(self._take, lines))
+            try:
+                return await asyncio.shield(take)
+            except asyncio.CancelledError:
+                # Let the thread finish; its records are in the replay file for the next take
+                await asyncio.wait((take,))
+                raise
+            except OSError:
+                self.buffer[:0] = lines
+                raise
+
+    async def done(self, unsent=()):
+        # The taken records went out, except ``unsent``, which the next take returns first
+        async with self._lock:
+            await asyncio.to_thread(self._done, [json.dumps(record) + "\n" for record in unsent])
+
+    def close(self):
+        lines, self.buffer = self.buffer, []
+        if lines:
+            self._write(lines)
+
+    def _write(self, lines):
+        if self._append(self.path, lines) > self.max_bytes:
+            self._compact()
+
+    @staticmethod
+    def _append(path, lines):
+        with open(path, "a") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def _compact(self):
+        with open(self.path) as f:
+            lines = f.readlines()
+        kept, size = [], 0
+        for line in reversed(lines):
+            size += len(line)
+            if size > self.max_bytes // 2:
+                break
+            kept.append(line)
+        self.dropped += len(lines) - len(kept)
+        log.warning("spool.compacted", max_bytes=self.max_bytes, dropped=len(lines) - len(kept))
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write("".join(reversed(kept)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def _take(self, lines):
+        replay = self.replay_path
+        if os.path.exists(self.path):
+            if os.path.exists(replay):
+                # Left over from a replay that did not finish; this spool comes after it
+                with open(self.path) as f:
+                    self._append(replay, f.readlines())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, replay)
+        if lines:
+            self._append(replay, lines)
+        try:
+            with open(replay) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass  # Torn last line after a power cut
+        return records
+
+    def _done(self, lines):
+        if not lines:
+            try:
+                os.remove(self.replay_path)
+            except FileNotFoundError:
+                pass
+            return
+        temporary = self.replay_path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.replay_path)
+
+
+class Outbox:
+    """Single outbound queue for a connection.
+
+    Messages go out in priority order (acknowledgements first, heartbeats
+    last), heartbeats coalesce so only the newest is queued, and the queue
+    holds at most ``max_messages``. Messages marked ``spool`` that cannot be
+    delivered go to the spool and are replayed in batches of ``replay_batch``
+    after the next ``attach``, behind live acknowledgements and events.
+    With ``metrics`` set, time queued and time to encode and send are
+    recorded per message type.
+    """
+
+    def __init__(self, spool=None, max_messages=500, encode=None, replay_batch=50, metrics=None):
+        self.spool = spool
+        self.metrics = metrics
+        self.max_messages = max_messages
+        self.encode = encode or (lambda message: json.dumps(message.payload))
+        self.replay_batch = replay_batch
+        self.queue = []
+        self.coalesced = {}
+        self.replay = deque()
+        self.replay_queued = 0
+        self.replaying = False  # Records taken from the spool that done() has not settled yet
+        self.websocket = None
+        self.sent = 0
+        self.dropped = 0
+        self._counter = itertools.count()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._sender = None
+
+    @property
+    def connected(self):
+        return self.websocket is not None
+
+    def put(self, payload, priority, kind=None, coalesce_key=None, spool=False):
+        message = OutboundMessage(payload, priority, kind, coalesce_key, spool)
+        if not self.connected:
+            self._discard(message)
+            return
+        if coalesce_key is not None and coalesce_key in self.coalesced:
+            self.coalesced[coalesce_key].payload = payload
+            return
+        if len(self.queue) >= self.max_messages and not self._make_room(message):
+            self._discard(message)
+            return
+        self._push(message)
+
+    def _push(self, message):
+        heapq.heappush(self.queue, (message.priority, next(self._counter), message))
+        if message.coalesce_key is not None:
+            self.coalesced[message.coalesce_key] = message
+        self._ready.set()
+        self._idle.clear()
+
+    def _make_room(self, message):
+        worst = max(range(len(self.queue)), key=lambda index: self.queue[index][:2])
+        if self.queue[worst][0] <= message.priority:
+            return False
+        _, _, evicted = self.queue.pop(worst)
+        heapq.heapify(self.queue)
+        if evicted.coalesce_key is not None:
+            self.coalesced.pop(evicted.coalesce_key, None)
+        if evicted.priority == PRIORITY_REPLAY:
+            self.replay_queued -= 1
+        self._discard(evicted)
+        return True
+
+    def _discard(self, message):
+        if message.spool and self.spool is not None:
+            self.spool.append(message.payload)
+        else:
+            self.dropped += 1
+
+    def attach(self, websocket):
+        self.websocket = websocket
+        self._sender = asyncio.create_task(self._send_loop(websocket))
+
+    async def detach(self):
+        self.websocket = None
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+            self._sender = None
+        queued = sorted(self.queue)
+        # Unsent replay records are older than anything in the queue, so they go back first
+        unsent = [message.payload for priority, _, message in queued if priority == PRIORITY_REPLAY]
+        unsent.extend(self.replay)
+        self.replay.clear()
+        if self.replaying:
+            self.replaying = False
+            try:
+                await self.spool.done(unsent)
+            except OSError as e:
+                log.error("spool.unwritable", path=self.spool.replay_path, error=e)
+                for payload in unsent:
+                    self.spool.append(payload)
+        for priority, _, message in queued:
+            if priority != PRIORITY_REPLAY:
+                self._discard(message)
+        self.queue.clear()
+        self.coalesced.clear()
+        self.replay_queued = 0
+        self._idle.set()
+
+    async def wait_sent(self, timeout):
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _load_replay_batch(self):
+        while self.replay and self.replay_queued < self.replay_batch:
+            self._push(OutboundMessage(self.replay.popleft(), PRIORITY_REPLAY, spool=True))
+            self.replay_queued += 1
+
+    async def _send_loop(self, websocket):
+        if self.spool is not None:
+            try:
+                self.replay.extend(await self.spool.take())
+            except OSError as e:
+                log.error("spool.unreadable", path=self.spool.path, error=e)
+            if self.replay:
+                self.replaying = True
+                log.info("spool.replay", messages=len(self.replay))
+        while True:
+            if self.replay_queued == 0:
+                self._load_replay_batch()
+            if self.replaying and self.replay_queued == 0:
+                self.replaying = False
+                try:
+                    await self.spool.done()
+                except OSError as e:
+                    log.error("spool.unwritable", path=self.spool.replay_path, error=e)
+            if not self.queue:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            priority, _, message = heapq.heappop(self.queue)
+            if message.coalesce_key is not None:
+                self.coalesced.pop(message.coalesce_key, None)
+            if priority == PRIORITY_REPLAY:
+                self.replay_queued -= 1
+            started = time.monotonic()
+            try:
+                await websocket.send(self.encode(message))
+            except (websockets.ConnectionClosed, asyncio.CancelledError) as e:
+                # Requeue so detach can spool it; at worst the server sees it twice
+                self._push(message)
+                if priority == PRIORITY_REPLAY:
+                    self.replay_queued += 1
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return
+            except Exception:
+                # One message that cannot be encoded or sent must not stop the heartbeats behind it
+                log.exception("outbox.send_failed", kind=message.kind)
+                self.dropped += 1
+                continue
+            self.sent += 1
+            if self.metrics is not None:
+                self.metrics.observe("panel_outbox_queue_seconds", started - message.queued_at, kind=message.kind)
+                self.metrics.observe("panel_outbox_send_seconds", time.monotonic() - started, kind=message.kind)
@@ -0,0 +1,216 @@
+import asyncio
+import time
+import json
+import os
+from dotenv import load_dotenv
+from connection import PanelClient, PanelConnection
+from dispatcher import InstructionDispatcher
+from gpio_handler import GPIOHandler
+from hardware import load_hardware
+from logs import get_logger
+from outbox import PRIORITY_EVENT, PRIORITY_HEARTBEAT
+from telemetry import SystemTelemetry
+
+log = get_logger(__name__)
+
+class PanelController(PanelClient):
+    def __init__(self, executor=None, display=None, gpio=None, telemetry=None, name=None, output=None, pins=None,
+                 metrics=None, connection=None):
+        load_dotenv()
+        self.client_name = name or os.getenv('CLIENT_NAME')
+        self.display_output = output or "HDMI-1"
+        # Panels of a hub are given the hub's connection, a lone panel opens its own
+        super().__init__(connection or PanelConnection(self.client_name, metrics))
+        self.connection.add_panel(self)
+        # HARDWARE picks the backends for whatever was not passed in; RPi.GPIO is only imported here
+        hardware = load_hardware()
+        self.executor = executor or hardware.executor(float(os.getenv('COMMAND_TIMEOUT', 10)))
+        self.telemetry = telemetry or SystemTelemetry(os.getenv('THERMAL_ROOT', '/sys/class/thermal'))
+        self.display = display or hardware.display(
+            self.executor, self.display_output, float(os.getenv('DISPLAY_VERIFY_INTERVAL', 60)))
+        self.display_watch_task = None
+
+        self.gpio = GPIOHandler(hardware.gpio() if gpio is None else gpio,
+                                debounce=float(os.getenv('GPIO_DEBOUNCE', 0.05)), **(pins or {}))
+        self.sensor_task = None
+        self.dispatcher = InstructionDispatcher(
+            self.process_instruction, self.acknowledge,
+            cache_size=int(os.getenv('INSTRUCTION_CACHE_SIZE', 256)),
+            metrics=self.metrics)
+
+        self.current_state = "off"
+
+    @property
+    def outputs(self):
+        return [self.display_output]
+
+    def is_active(self):
+        return self.gpio.snapshot["isDoorOpen"]
+
+    def start_panel(self):
+        self.gpio.attach(asyncio.get_running_loop())
+        self.sensor_task = asyncio.create_task(self.send_sensor_events())
+        self.display_watch_task = asyncio.create_task(self.display.watch())
+
+    def panel_metrics(self):
+        labels = {"panel": self.client_name}
+        yield "panel_instructions_executed_total", "counter", labels, self.dispatcher.executed
+        yield "panel_instructions_superseded_total", "counter", labels, self.dispatcher.superseded
+        yield "panel_instructions_duplicate_total", "counter", labels, self.dispatcher.duplicates
+
+    async def setup_display(self):
+        steps = [self.disable_screen_sleep()]
+        if self.display.state != "off":
+            steps.append(self.turn_off_screen())
+        await asyncio.gather(*steps)
+        self.connection.startup.mark("display_ready")
+
+# Initialize state
+    async def register(self, websocket, resume=False):
+        client_type = self.connection.client_type
+        self.connection.reset_heartbeat_mode()
+        registration_message = {
+            "type": "register",
+            "clientType": client_type,
+            "name": self.client_name,
+            "heartbeatModes": self.connection.heartbeat_modes,
+        }
+        if resume:
+            # Screen and X settings survived the short outage, only tell the server where we are
+            registration_message["resume"] = True
+            registration_message["state"] = self.display.state
+            await websocket.send(json.dumps(registration_message))
+            log.info("register.resumed", client_type=client_type, name=self.client_name, state=self.display.state)
+            return
+        await websocket.send(json.dumps(registration_message))
+        log.info("register.sent", client_type=client_type, name=self.client_name)
+
+    def route_instruction(self, data):
+        return self
+
+    async def process_instruction(self, instruction):
+        status = 'completed'
+        self.connection.heartbeat_scheduler.mark_active()
+        display_task = self.connection.display_task
+        if instruction in ("on", "off") and display_task is not None and not display_task.done():
+            await asyncio.wait((display_task,))  # The boot blanking must not land after an "on"
+        if instruction == "on":
+            if not await self.turn_on_screen():
+                status = 'failed'
+        elif instruction == "off":
+            if not await self.turn_off_screen():
+                status = 'failed'
+        elif instruction == "refresh":
+            log.info("instruction.refresh", name=self.client_name)
+        elif instruction == "reboot":
+            await self.set_rebooting_state()
+            await self.connection.outbox.wait_sent(1)  # Ensure the message is sent before rebooting
+            await self.reboot()
+            return status
+
+        if instruction not in ("on", "off", "refresh"):
+            log.warning("instruction.unknown", instruction=instruction)
+        # Send an immediate heartbeat after processing the instruction
+        await self.send_heartbeat_to_server()
+        return status
+
+    async def set_rebooting_state(self):
+        self.current_state = "rebooting"
+        await self.send_heartbeat_to_server()
+        log.info("state.rebooting", name=self.client_name)
+
+
+    async def send_rebooting_status(self, websocket):
+        try:
+            data = {
+                "type": "heartbeat",
+                "state": "rebooting",
+                "cpuTemp": await self.get_cpu_temperature(),
+                **self.gpio.snapshot,
+                "name": self.client_name
+            }
+            await websocket.send(json.dumps(data))
+            log.info("state.rebooting_sent", name=self.client_name)
+        except Exception as e:
+            log.warning("state.rebooting_failed", error=e)
+
+    async def reboot(self):
+        log.warning("reboot", name=self.client_name)
+        self.current_state = None  # Reset the state after reboot
+        await asyncio.sleep(1)
+        await self.executor.run("sudo", "reboot")
+
+    async def build_heartbeat(self):
+        display_state = await self.get_display_state()
+        state = self.current_state if self.current_state == 'rebooting' else display_state
+        return {
+            "type": "heartbeat",
+            "state": state,
+            "cpuTemp": await self.get_cpu_temperature(),
+            **self.gpio.snapshot,
+            "name": self.client_name,
+            **self.telemetry.system_metrics()
+        }
+
+    async def send_heartbeat_to_server(self):
+        try:
+            started = time.monotonic()
+            data = await self.build_heartbeat()
+            if self.connection.metrics_in_heartbeat:
+                data.update(self.metrics.summary())
+            self.metrics.observe("panel_heartbeat_build_seconds", time.monotonic() - started)
+            # Only the newest heartbeat is worth sending, and none while offline
+            self.connection.outbox.put(data, PRIORITY_HEARTBEAT, kind="heartbeat",
+                                       coalesce_key=f"heartbeat:{self.client_name}")
+            self.connection.startup.mark("first_heartbeat")
+            log.info("heartbeat.queued", name=self.client_name, state=data['state'], interval=self.heartbeat_interval)
+        except Exception as e:
+            log.warning("heartbeat.failed", error=e)
+
+    async def send_sensor_events(self):
+        async for event in self.gpio.stream():
+            data = {
+                "type": "sensorEvent",
+                "name": self.client_name,
+                "sensor": event.sensor,
+                "value": event.value,
+                "timestamp": time.time(),
+            }
+            self.connection.outbox.put(data, PRIORITY_EVENT, spool=True)
+            self.connection.heartbeat_scheduler.mark_active()
+            log.info("sensor.event", name=self.client_name, sensor=event.sensor, value=event.value)
+
+    async def get_cpu_temperature(self):
+        return self.telemetry.cpu_temperature()
+
+    async def get_display_state(self):
+        return self.display.state
+
+    async def disable_screen_sleep(self):
+        await self.display.prepare()
+
+    async def turn_off_screen(self):
+        started = time.monotonic()
+        done = await self.display.turn_off()
+        self.metrics.observe("panel_screen_command_seconds", time.monotonic() - started, command="off")
+        if not done:
+            return False
+        self.gpio.set_leds(False, False)
+        log.info("screen.off", output=self.display_output)
+        return True
+
+    async def turn_on_screen(self):
+        started = time.monotonic()
+        done = await self.display.turn_on()
+        self.metrics.observe("panel_screen_command_seconds", time.monotonic() - started, command="on")
+        if not done:
+            return False
+        self.gpio.set_leds(True, True)
+        log.info("screen.on", output=self.display_output)
+        return True
+
+
+    def cleanup(self):
+        self.connection.close()
+        self.telemetry.close()
+        self.gpio.cleanup()
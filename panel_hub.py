@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import time
+from dotenv import load_dotenv
+from connection import PanelClient, PanelConnection
+from hardware import load_hardware
+from logs import get_logger
+from outbox import PRIORITY_HEARTBEAT
+from panel_controller import PanelController
+from telemetry import SystemTelemetry
+
+log = get_logger(__name__)
+
+INPUT_PINS = ("door_sensor_pin", "sector_status_pin", "button_pin")
+LED_PINS = {"led1_pin": 22, "led2_pin": 10}  # GPIOHandler's defaults
+
+
+def check_config(config):
+    # RPi.GPIO refuses a second edge detector on a pin, and two panels on one output would fight over it
+    outputs, pins = {}, {}
+    for entry in config:
+        name = entry.get("name")
+        if not name:
+            raise ValueError("Every panel in the hub config needs a name")
+        if any(other["name"] == name for other in outputs.values()):
+            raise ValueError(f"Panel name {name} is used twice")
+        output = entry.get("output")
+        if not output:
+            raise ValueError(f"Panel {name} has no output")
+        if output in outputs:
+            raise ValueError(f"Panels {outputs[output]['name']} and {name} both use output {output}")
+        outputs[output] = entry
+        entry_pins = {**LED_PINS, **(entry.get("pins") or {})}
+        missing = [role for role in INPUT_PINS if role not in entry_pins]
+        if missing:
+            raise ValueError(f"Panel {name} has no {', '.join(missing)}")
+        for role, pin in entry_pins.items():
+            if pin in pins:
+                raise ValueError(f"GPIO {pin} is both {pins[pin]} and {name} {role}")
+            pins[pin] = f"{name} {role}"
+
+
+class PanelHub(PanelClient):
+    """Several panels of one cabinet behind a single websocket.
+
+    Each panel keeps its own output, pins, name and instruction dispatcher;
+    the panels are built on one shared PanelConnection, which owns the
+    outbox, spool, reconnect policy and heartbeat schedule. Every panel
+    registers under its own name on the shared connection, instructions are
+    routed by panel name (those naming no known panel are acknowledged as
+    ``unknownPanel``) and each scheduled heartbeat carries all panels in one
+    ``heartbeatBatch`` frame.
+    """
+
+    def __init__(self, panels, executor=None):
+        if not panels:
+            raise ValueError("A panel hub needs at least one panel")
+        connection = panels[0].connection
+        if any(panel.connection is not connection for panel in panels):
+            raise ValueError("The panels of a hub must share one connection")
+        super().__init__(connection)
+        self.panels = panels
+        self.panels_by_name = {panel.client_name: panel for panel in panels}
+        self.client_name = connection.name or "+".join(self.panels_by_name)
+        self.executor = executor or panels[0].executor
+        # Batches are plain JSON, the connection's deflate takes care of the repetition
+        connection.heartbeat_modes = ["json"]
+
+    @classmethod
+    def from_config(cls, path, gpio=None):
+        # [{"name": "...", "output": "HDMI-1", "pins": {"door_sensor_pin": 17, ...}}, ...]
+        # Every panel needs its own output and input pins; LED pins default to 22 and 10, so every panel but one sets its own
+        with open(path) as f:
+            config = json.load(f)
+        check_config(config)
+        load_dotenv()
+        hardware = load_hardware()
+        executor = hardware.executor(float(os.getenv('COMMAND_TIMEOUT', 10)))
+        gpio = hardware.gpio() if gpio is None else gpio
+        telemetry = SystemTelemetry(os.getenv('THERMAL_ROOT', '/sys/class/thermal'))
+        connection = PanelConnection(os.getenv('CLIENT_NAME') or "+".join(entry["name"] for entry in config))
+        panels = [
+            PanelController(executor=executor, gpio=gpio, telemetry=telemetry, name=entry["name"],
+                            output=entry.get("output"), pins=entry.get("pins"), connection=connection)
+            for entry in config
+        ]
+        return cls(panels, executor)
+
+    @property
+    def outputs(self):
+        return [panel.display_output for panel in self.panels]
+
+    def is_active(self):
+        return self.connection.is_active()
+
+    def start_panel(self):
+        for panel in self.panels:
+            panel.start_panel()
+
+    def panel_metrics(self):
+        for panel in self.panels:
+            yield from panel.panel_metrics()
+
+    async def register(self, websocket, resume=False):
+        client_type = self.connection.client_type
+        for panel in self.panels:
+            registration_message = {
+                "type": "register",
+                "clientType": client_type,
+                "name": panel.client_name,
+                "output": panel.display_output,
+                "heartbeatModes": self.connection.heartbeat_modes,
+                "heartbeatBatch": True,
+            }
+            if resume:
+                registration_message["resume"] = True
+                registration_message["state"] = panel.display.state
+            await websocket.send(json.dumps(registration_message))
+        log.info("register.resumed" if resume else "register.sent", client_type=client_type,
+                 panels=",".join(self.panels_by_name))
+
+    def route_instruction(self, data):
+        name = data.get("name") or data.get("panelName")
+        if name is None and len(self.panels) == 1:
+            return self.panels[0]
+        panel = self.panels_by_name.get(name)
+        if panel is None:
+            log.warning("instruction.unknown_panel", id=data.get('instructionId'), name=name)
+        return panel
+
+    async def send_heartbeat_to_server(self):
+        try:
+            started = time.monotonic()
+            heartbeats = await asyncio.gather(*(panel.build_heartbeat() for panel in self.panels))
+            data = {"type": "heartbeatBatch", "heartbeats": list(heartbeats)}
+            if self.connection.metrics_in_heartbeat:
+                data.update(self.metrics.summary())  # Once per batch, not per panel
+            self.metrics.observe("panel_heartbeat_build_seconds", time.monotonic() - started)
+            self.connection.outbox.put(data, PRIORITY_HEARTBEAT, kind="heartbeatBatch", coalesce_key="heartbeat")
+            self.connection.startup.mark("first_heartbeat")
+            log.info("heartbeat.queued", panels=len(heartbeats), interval=self.heartbeat_interval)
+        except Exception as e:
+            log.warning("heartbeat.failed", error=e)
+
+    async def setup_display(self):
+        await asyncio.gather(self.disable_screen_sleep(),
+                             *(panel.turn_off_screen() for panel in self.panels if panel.display.state != "off"))
+        self.connection.startup.mark("display_ready")
+
+    async def disable_screen_sleep(self):
+        # xset settings are per X display, not per output
+        await self.panels[0].disable_screen_sleep()
+
+    async def turn_off_screen(self):
+        return all(await asyncio.gather(*(panel.turn_off_screen() for panel in self.panels)))
+
+    async def turn_on_screen(self):
+        return all(await asyncio.gather(*(panel.turn_on_screen() for panel in self.panels)))
+
+    def cleanup(self):
+        self.connection.close()
+        for panel in self.panels:
+            panel.telemetry.close()
+            panel.gpio.cleanup()
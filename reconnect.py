@@ -0,0 +1,101 @@
+import random
+import socket
+import time
+from collections import deque
+
+
+class ReconnectPolicy:
+    def reset(self):
+        pass
+
+    def next_delay(self):
+        raise NotImplementedError
+
+
+class FixedDelay(ReconnectPolicy):
+    def __init__(self, delay=5):
+        self.delay = delay
+
+    def next_delay(self):
+        return self.delay
+
+
+class DecorrelatedJitterBackoff(ReconnectPolicy):
+    """Exponential backoff with decorrelated jitter.
+
+    Each delay is drawn uniformly between ``base`` and three times the
+    previous delay, capped at ``cap``, so panels that lost the server at the
+    same instant quickly spread out instead of retrying in lockstep.
+    """
+
+    def __init__(self, base=0.5, cap=60, rng=None):
+        self.base = base
+        self.cap = cap
+        self.random = rng or random.Random()
+        self.delay = base
+
+    def reset(self):
+        self.delay = self.base
+
+    def next_delay(self):
+        self.delay = min(self.cap, self.random.uniform(self.base, self.delay * 3))
+        return self.delay
+
+
+def make_reconnect_policy(name, base=0.5, cap=60, delay=5):
+    if name == "fixed":
+        return FixedDelay(delay)
+    if name == "backoff":
+        return DecorrelatedJitterBackoff(base, cap)
+    raise ValueError(f"Unknown reconnect policy {name}")
+
+
+class ReconnectStats:
+    def __init__(self, history=50):
+        self.attempts = 0
+        self.reconnects = 0
+        self.disconnected_at = None
+        self.connected_at = None
+        self.history = deque(maxlen=history)  # (time_to_reconnect, attempts) per outage
+
+    def attempt(self):
+        self.attempts += 1
+
+    def connected(self):
+        now = time.monotonic()
+        gap = None
+        if self.disconnected_at is not None:
+            gap = now - self.disconnected_at
+            self.reconnects += 1
+            self.history.append((gap, self.attempts))
+        self.disconnected_at = None
+        self.connected_at = now
+        self.attempts = 0
+        return gap
+
+    def disconnected(self):
+        if self.disconnected_at is None:
+            self.disconnected_at = time.monotonic()
+        uptime = None if self.connected_at is None else self.disconnected_at - self.connected_at
+        self.connected_at = None
+        return uptime
+
+    def as_dict(self):
+        last_gap, last_attempts = self.history[-1] if self.history else (None, None)
+        return {
+            "reconnects": self.reconnects,
+            "lastTimeToReconnect": last_gap,
+            "lastAttempts": last_attempts,
+            "maxTimeToReconnect": max((gap for gap, _ in self.history), default=None),
+        }
+
+
+def enable_tcp_keepalive(websocket, idle=30, interval=10, count=3):
+    sock = websocket.transport.get_extra_info("socket")
+    if sock is None:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # The per-socket timers are Linux specific
+    for option, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
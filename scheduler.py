@@ -0,0 +1,100 @@
+import asyncio
+import math
+import random
+import time
+import zlib
+
+
+def phase_for(name):
+    # Stable per-client offset in [0, 1) so panels booted together spread over the interval
+    return zlib.crc32((name or "").encode()) / 2**32
+
+
+class HeartbeatScheduler:
+    """Drift-free heartbeat ticks on a monotonic-clock grid.
+
+    Ticks fall on ``anchor + k * interval`` no matter how long each heartbeat
+    took to build and send; ticks missed while the loop was busy collapse into
+    one. The first tick is immediate, the grid is offset by ``phase`` of an
+    interval and each tick moves by up to ``jitter`` seconds without shifting
+    the grid. With ``fast_interval`` or ``idle_interval`` set, the interval
+    follows activity: fast while ``is_active()`` is true or for
+    ``active_hold`` seconds after ``mark_active``, idle otherwise.
+    """
+
+    def __init__(self, interval=5, phase=0.0, jitter=0.0, fast_interval=None, idle_interval=None,
+                 active_hold=30, is_active=None, rng=None, clock=time.monotonic):
+        self.interval = interval
+        self.phase = phase
+        self.jitter = jitter
+        self.fast_interval = fast_interval
+        self.idle_interval = idle_interval
+        self.active_hold = active_hold
+        self.is_active = is_active
+        self.random = rng or random.Random()
+        self.clock = clock
+        self.active_until = 0.0
+        self._changed = asyncio.Event()
+
+    @property
+    def adaptive(self):
+        return self.fast_interval is not None or self.idle_interval is not None
+
+    def active(self):
+        return self.clock() < self.active_until or bool(self.is_active and self.is_active())
+
+    def current_interval(self):
+        if not self.adaptive:
+            return self.interval
+        if self.active():
+            return min(self.fast_interval or self.interval, self.interval)
+        return max(self.idle_interval or self.interval, self.interval)
+
+    def set_interval(self, interval):
+        self.interval = interval
+        self._changed.set()
+
+    def mark_active(self):
+        was_active = self.active()
+        self.active_until = self.clock() + self.active_hold
+        if self.adaptive and not was_active:
+            self._changed.set()
+
+    def wake(self):
+        self._changed.set()
+
+    async def ticks(self):
+        interval = self.current_interval()
+        start = last_grid = self.clock()
+        anchor = start + self.phase * interval
+        next_k = 0 if self.phase else 1
+        jitter_k, offset = None, 0.0
+        yield start
+
+        while True:
+            self._changed.clear()
+            current = self.current_interval()
+            if current != interval:
+                # Keep the beat that already went out and space the next ones with the new interval
+                anchor, interval, next_k, jitter_k = last_grid, current, 1, None
+
+            now = self.clock()
+            next_k = max(next_k, math.floor((now - anchor) / interval))
+            if jitter_k != next_k:
+                jitter_k, offset = next_k, self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+            deadline = anchor + next_k * interval + offset
+
+            # Also wake periodically so an is_active() change is noticed without an explicit wake
+            timeout = deadline - now
+            if self.adaptive:
+                timeout = min(timeout, self.fast_interval or interval)
+            try:
+                await asyncio.wait_for(self._changed.wait(), max(0.0, timeout))
+                continue
+            except asyncio.TimeoutError:
+                pass
+            if self.clock() < deadline:
+                continue
+            last_grid = anchor + next_k * interval
+            next_k += 1
+            yield self.clock()
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import websockets
+
+from heartbeat import HeartbeatDecoder
+
+
+def percentiles(values, points=(50, 90, 99)):
+    values = sorted(values)
+    if not values:
+        return {f"p{point}": None for point in points}
+    return {f"p{point}": values[min(len(values) - 1, int(len(values) * point / 100))] for point in points}
+
+
+class StandInServer:
+    """Local stand-in for the panel server, for load tests and development.
+
+    Accepts panel registrations, several per connection for multi-panel
+    clients, decodes heartbeats in every mode and batches, sends
+    instructions to random panels at ``instruction_rate`` per second and
+    records instruction-to-ack latency and heartbeat arrival times.
+    """
+
+    def __init__(self, instruction_rate=0.0, instructions=("on", "off", "refresh"), heartbeat_mode="json", seed=None):
+        self.instruction_rate = instruction_rate
+        self.instructions = instructions
+        self.heartbeat_mode = heartbeat_mode
+        self.random = random.Random(seed)
+        self.panels = {}
+        self.registered_at = {}
+        self.heartbeats = defaultdict(list)
+        self.instructed_at = defaultdict(list)
+        self.pending = {}
+        self.ack_latencies = []
+        self.counts = Counter()
+        self.all_registered = asyncio.Event()
+        self.expected_panels = None
+
+    async def handler(self, websocket):
+        name = None
+        names = set()
+        decoder = HeartbeatDecoder()
+        try:
+            async for message in websocket:
+                received_at = time.monotonic()
+                if isinstance(message, bytes):
+                    heartbeat = decoder.decode(message)
+                    self.record_heartbeat(name or (heartbeat or {}).get("name"), received_at)
+                    continue
+                data = json.loads(message)
+                kind = data.get("type")
+                if kind not in ("heartbeat", "heartbeatDelta", "heartbeatBatch"):
+                    self.counts[kind] += 1
+                if kind == "register":
+                    name = data.get("name")
+                    names.add(name)
+                    await self.register(name, data, websocket, received_at)
+                elif kind in ("heartbeat", "heartbeatDelta"):
+                    decoder.decode(message)
+                    self.record_heartbeat(data.get("name") or name, received_at)
+                elif kind == "heartbeatBatch":
+                    self.counts["heartbeatBatch"] += 1
+                    for heartbeat in data.get("heartbeats", ()):
+                        self.record_heartbeat(heartbeat.get("name"), received_at)
+                elif kind == "acknowledgement":
+                    sent_at = self.pending.pop(data.get("instructionId"), None)
+                    if sent_at is not None:
+                        self.ack_latencies.append(received_at - sent_at)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for name in names:
+                if self.panels.get(name) is websocket:
+                    del self.panels[name]
+
+    async def register(self, name, data, websocket, received_at):
+        self.panels[name] = websocket
+        self.registered_at.setdefault(name, received_at)
+        reply = {"type": "registered", "name": name}
+        if self.heartbeat_mode in data.get("heartbeatModes", ()):
+            reply["heartbeatMode"] = self.heartbeat_mode
+        await websocket.send(json.dumps(reply))
+        if self.expected_panels is not None and len(self.registered_at) >= self.expected_panels:
+            self.all_registered.set()
+
+    def record_heartbeat(self, name, received_at):
+        self.counts["heartbeat"] += 1
+        if name is not None:
+            self.heartbeats[name].append(received_at)
+
+    async def send_instructions(self):
+        if self.instruction_rate <= 0:
+            return
+        period = 1.0 / self.instruction_rate
+        deadline = time.monotonic()
+        while True:
+            deadline += period
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            if not self.panels:
+                continue
+            name = self.random.choice(list(self.panels))
+            instruction_id = uuid.uuid4().hex
+            message = {
+                "type": "instruction",
+                "to": "panel",
+                "instruction": self.random.choice(self.instructions),
+                "instructionId": instruction_id,
+                "name": name,
+            }
+            now = time.monotonic()
+            self.pending[instruction_id] = now
+            self.instructed_at[name].append(now)
+            try:
+                await self.panels[name].send(json.dumps(message))
+                self.counts["instruction"] += 1
+            except (KeyError, websockets.ConnectionClosed):
+                self.pending.pop(instruction_id, None)
+
+    def heartbeat_jitter(self, expected_interval):
+        # The first heartbeat after an instruction is the client's immediate
+        # status update, not part of the schedule, so it is left out. So is the
+        # first interval, which a client shortens to reach its phase offset.
+        jitter = []
+        for name, arrivals in self.heartbeats.items():
+            instructed_at = self.instructed_at.get(name, [])
+            scheduled = arrivals[:1]
+            for previous, current in zip(arrivals, arrivals[1:]):
+                index = bisect.bisect_right(instructed_at, previous)
+                if index < len(instructed_at) and instructed_at[index] <= current:
+                    continue
+                scheduled.append(current)
+            jitter.extend(abs(current - previous - expected_interval)
+                          for previous, current in zip(scheduled[1:], scheduled[2:]))
+        return jitter
+
+    def summary(self, expected_interval):
+        return {
+            "connected": len(self.panels),
+            "messages": dict(self.counts),
+            "ackLatency": percentiles(self.ack_latencies),
+            "unacknowledged": len(self.pending),
+            "heartbeatJitter": percentiles(self.heartbeat_jitter(expected_interval)),
+        }
+
+
+async def main(args):
+    server = StandInServer(args.instruction_rate, heartbeat_mode=args.heartbeat_mode)
+    async with websockets.serve(server.handler, args.host, args.port, max_size=2**20):
+        print(f"Stand-in server listening on ws://{args.host}:{args.port}")
+        instruction_task = asyncio.create_task(server.send_instructions())
+        try:
+            while True:
+                await asyncio.sleep(args.report_interval)
+                print(json.dumps(server.summary(args.heartbeat_interval)))
+        finally:
+            instruction_task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the panel websocket server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--instruction-rate", type=float, default=0.0, help="instructions per second across all panels")
+    parser.add_argument("--heartbeat-mode", default="json", help="heartbeat mode to select when a panel offers it")
+    parser.add_argument("--heartbeat-interval", type=float, default=5, help="expected interval for jitter figures")
+    parser.add_argument("--report-interval", type=float, default=10)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,124 @@
+import glob
+import math
+import os
+import re
+import time
+
+import psutil
+
+from logs import get_logger
+
+log = get_logger(__name__)
+
+
+class ThermalReader:
+    """Reads /sys/class/thermal without forking.
+
+    Zones are discovered once and their ``temp`` files kept open; every read
+    is a single pread at offset 0, which makes sysfs regenerate the value.
+    """
+
+    def __init__(self, root="/sys/class/thermal"):
+        self.root = root
+        self.zones = []
+        self.discover()
+
+    def discover(self):
+        self.close()
+        paths = glob.glob(os.path.join(self.root, "thermal_zone*"))
+        paths.sort(key=lambda p: int(re.sub(r"\D", "", os.path.basename(p)) or 0))
+        for path in paths:
+            try:
+                fd = os.open(os.path.join(path, "temp"), os.O_RDONLY)
+            except OSError as e:
+                log.warning("thermal.zone_skipped", path=path, error=e)
+                continue
+            self.zones.append((os.path.basename(path), self._read_type(path), fd))
+
+    @staticmethod
+    def _read_type(path):
+        try:
+            with open(os.path.join(path, "type")) as f:
+                return f.read().strip()
+        except OSError:
+            return os.path.basename(path)
+
+    @staticmethod
+    def _read_millidegrees(fd):
+        return int(os.pread(fd, 16, 0))
+
+    def cpu_temperature(self):
+        if not self.zones:
+            return None
+        try:
+            return math.floor(self._read_millidegrees(self.zones[0][2]) / 1000.0)
+        except (OSError, ValueError) as e:
+            log.warning("thermal.read_failed", error=e)
+            return None
+
+    def close(self):
+        for _, _, fd in self.zones:
+            os.close(fd)
+        self.zones = []
+
+
+class SystemTelemetry:
+    """CPU temperature and host load for heartbeats.
+
+    CPU load is the average since the previous sample, so it is resampled
+    at most every ``cpu_interval`` seconds and cached in between; heartbeats
+    close together, or the panels of one batch, all report the same value.
+    """
+
+    def __init__(self, thermal_root="/sys/class/thermal", disk_path="/", cpu_interval=5.0, clock=time.monotonic):
+        self.thermal = ThermalReader(thermal_root)
+        self.disk_path = disk_path
+        self.boot_time = psutil.boot_time()
+        self.cpu_interval = cpu_interval
+        self.clock = clock
+        self.cpu_load = None  # Until a full interval has passed
+        psutil.cpu_percent(interval=None)  # Prime the counter, the first call always returns 0.0
+        self.cpu_sampled_at = clock()
+
+    def cpu_temperature(self):
+        return self.thermal.cpu_temperature()
+
+    def sample_cpu_load(self):
+        now = self.clock()
+        if now - self.cpu_sampled_at >= self.cpu_interval:
+            self.cpu_load = psutil.cpu_percent(interval=None)
+            self.cpu_sampled_at = now
+        return self.cpu_load
+
+    def system_metrics(self):
+        try:
+            return {
+                "cpuLoad": self.sample_cpu_load(),
+                "memoryUsage": psutil.virtual_memory().percent,
+                "diskUsage": psutil.disk_usage(self.disk_path).percent,
+                "uptime": int(time.time() - self.boot_time),
+            }
+        except OSError as e:
+            log.warning("metrics.read_failed", error=e)
+            return {}
+
+    def close(self):
+        self.thermal.close()
+
+
+class SimulatedTelemetry:
+    """Fixed readings for simulations and tests; reads no files and no psutil counters."""
+
+    def __init__(self, temperature=50, cpu_load=5.0, memory_usage=30.0, disk_usage=40.0):
+        self.temperature = temperature
+        self.metrics = {"cpuLoad": cpu_load, "memoryUsage": memory_usage, "diskUsage": disk_usage}
+        self.started = time.monotonic()
+
+    def cpu_temperature(self):
+        return self.temperature
+
+    def system_metrics(self):
+        return {**self.metrics, "uptime": int(time.monotonic() - self.started)}
+
+    def close(self):
+        pass
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+import selectors
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RecordingWebSocket:
+    """Stands in for a connected websocket and keeps every message sent, decoded."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+class VirtualTimeSelector:
+    """Selector that never blocks on a timer: it moves the loop's clock instead."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.selector = selectors.DefaultSelector()
+
+    def select(self, timeout=None):
+        events = self.selector.select(0 if timeout is not None else None)
+        if not events and timeout:
+            self.loop.now += timeout
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose ``time()`` only advances when every task is waiting.
+
+    Sleeps and timeouts complete instantly and exactly, so code driven by
+    ``loop.time`` can be checked against precise deadlines. Not for code that
+    waits on threads.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        super().__init__(VirtualTimeSelector(self))
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def virtual_loop():
+    loop = VirtualTimeLoop()
+    yield loop
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
@@ -0,0 +1,158 @@
+import asyncio
+import random
+
+from dispatcher import InstructionDispatcher
+
+
+class Panel:
+    """Records executions and acknowledgements; display commands take ``delay`` seconds."""
+
+    def __init__(self, delay=1.0, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.executed = []
+        self.acks = []
+
+    async def execute(self, instruction):
+        self.executed.append(instruction)
+        if instruction in self.fail:
+            raise RuntimeError("command failed")
+        if instruction in ("on", "off"):
+            await asyncio.sleep(self.delay)
+        return "success"
+
+    async def acknowledge(self, instruction_id, status):
+        self.acks.append((instruction_id, status))
+
+
+def dispatch(loop, panel, instructions, cache_size=256):
+    # Submits the first instruction, lets it start, then submits the rest in one burst
+    async def run():
+        dispatcher = InstructionDispatcher(panel.execute, panel.acknowledge, cache_size=cache_size)
+        for index, (instruction_id, instruction) in enumerate(instructions):
+            dispatcher.submit(instruction_id, instruction)
+            if index == 0:
+                await asyncio.sleep(0)
+        await dispatcher.drain()
+        return dispatcher
+    return loop.run_until_complete(run())
+
+
+def test_display_burst_runs_the_first_and_last_only(virtual_loop):
+    panel = Panel()
+    dispatcher = dispatch(virtual_loop, panel, [("1", "on"), ("2", "off"), ("3", "on"), ("4", "off")])
+    assert panel.executed == ["on", "off"]
+    assert sorted(panel.acks) == [("1", "success"), ("2", "superseded"), ("3", "superseded"), ("4", "success")]
+    assert (dispatcher.executed, dispatcher.superseded) == (2, 2)
+
+
+def test_superseded_acks_go_out_before_the_running_command_finishes(virtual_loop):
+    panel = Panel(delay=10)
+
+    async def run():
+        dispatcher = InstructionDispatcher(panel.execute, panel.acknowledge)
+        dispatcher.submit("1", "on")
+        await asyncio.sleep(0)
+        dispatcher.submit("2", "off")
+        dispatcher.submit("3", "on")
+        await asyncio.sleep(1)
+        acks = list(panel.acks)
+        await dispatcher.drain()
+        return acks
+
+    assert virtual_loop.run_until_complete(run()) == [("2", "superseded")]
+
+
+def test_instructions_without_a_resource_do_not_wait(virtual_loop):
+    panel = Panel(delay=10)
+
+    async def run():
+        dispatcher = InstructionDispatcher(panel.execute, panel.acknowledge)
+        dispatcher.submit("1", "on")
+        dispatcher.submit("2", "refresh")
+        await asyncio.sleep(0.1)
+        acks = list(panel.acks)
+        await dispatcher.drain()
+        return acks
+
+    assert virtual_loop.run_until_complete(run()) == [("2", "success")]
+
+
+def test_duplicate_while_in_flight_runs_once(virtual_loop):
+    panel = Panel()
+    dispatcher = dispatch(virtual_loop, panel, [("1", "on"), ("1", "on")])
+    assert panel.executed == ["on"]
+    assert panel.acks == [("1", "success")]
+    assert dispatcher.duplicates == 1
+
+
+def test_retransmission_is_acknowledged_from_the_cache(virtual_loop):
+    panel = Panel(fail={"reboot"})
+
+    async def run():
+        dispatcher = InstructionDispatcher(panel.execute, panel.acknowledge)
+        dispatcher.submit("1", "on")
+        dispatcher.submit("2", "reboot")
+        await dispatcher.drain()
+        dispatcher.submit("1", "on")
+        dispatcher.submit("2", "reboot")
+        await dispatcher.drain()
+        return dispatcher
+
+    dispatcher = virtual_loop.run_until_complete(run())
+    assert panel.executed == ["on", "reboot"]
+    assert panel.acks.count(("1", "success")) == 2
+    assert panel.acks.count(("2", "failed")) == 2
+    assert dispatcher.duplicates == 2
+
+
+def test_cache_forgets_the_oldest_ids(virtual_loop):
+    panel = Panel()
+
+    async def run():
+        dispatcher = InstructionDispatcher(panel.execute, panel.acknowledge, cache_size=2)
+        for instruction_id in ("1", "2", "3"):
+            dispatcher.submit(instruction_id, "refresh")
+            await dispatcher.drain()
+        dispatcher.submit("3", "refresh")  # Still cached
+        dispatcher.submit("1", "refresh")  # Evicted, runs again
+        await dispatcher.drain()
+        return dispatcher
+
+    dispatcher = virtual_loop.run_until_complete(run())
+    assert list(dispatcher.results) == ["3", "1"]
+    assert panel.executed == ["refresh"] * 4
+    assert dispatcher.duplicates == 1
+
+
+def test_instructions_without_id_are_never_deduplicated(virtual_loop):
+    panel = Panel()
+    dispatcher = dispatch(virtual_loop, panel, [(None, "refresh"), (None, "refresh")])
+    assert panel.executed == ["refresh", "refresh"]
+    assert dispatcher.duplicates == 0
+    assert not dispatcher.results
+
+
+def test_flood_acknowledges_every_instruction_once(virtual_loop):
+    rng = random.Random(1)
+    instructions = []
+    for index in range(2000):
+        if instructions and rng.random() < 0.2:
+            instructions.append(rng.choice(instructions))
+        else:
+            instructions.append((f"i{index}", rng.choice(("on", "off", "refresh"))))
+    instructions.insert(0, ("first", "on"))
+    unique = dict(instructions)
+    panel = Panel(delay=0.5)
+
+    started = virtual_loop.time()
+    dispatcher = dispatch(virtual_loop, panel, instructions)
+    elapsed = virtual_loop.time() - started
+
+    acked = [instruction_id for instruction_id, _ in panel.acks]
+    assert len(acked) == len(set(acked)) == len(unique)
+    # The whole burst collapses into the first and the last display command
+    display = sum(1 for instruction in unique.values() if instruction != "refresh")
+    assert panel.executed.count("on") + panel.executed.count("off") == 2
+    assert dispatcher.superseded == display - 2
+    assert elapsed == 1.0  # Two display commands of 0.5s; everything else ran alongside
@@ -0,0 +1,58 @@
+import asyncio
+
+from display import FakeDisplay
+
+
+class SlowQueryDisplay(FakeDisplay):
+    """FakeDisplay whose query answers only once ``answer`` is set."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.answer = asyncio.Event()
+
+    async def query(self):
+        actual = self.actual
+        await self.answer.wait()
+        return actual
+
+
+def test_refresh_picks_up_changes_made_outside():
+    display = FakeDisplay(actual="off")
+
+    async def main():
+        await display.turn_on()
+        display.set_actual("off")
+        return await display.refresh()
+
+    assert asyncio.run(main()) == "off"
+    assert display.state == "off"
+    assert display.verified_at is not None
+
+
+def test_refresh_ignores_a_failed_query():
+    display = FakeDisplay()
+
+    async def main():
+        await display.turn_on()
+        await display.refresh()
+        verified_at = display.verified_at
+        display.set_actual("unknown")
+        return await display.refresh(), verified_at
+
+    state, verified_at = asyncio.run(main())
+    assert state == display.state == "on"
+    assert display.verified_at == verified_at
+
+
+def test_refresh_overlapping_a_power_command_keeps_its_result():
+    async def main():
+        display = SlowQueryDisplay(actual="off")
+        refresh = asyncio.create_task(display.refresh())
+        await asyncio.sleep(0)  # The query has read "off" and is waiting
+        await display.turn_on()
+        display.answer.set()
+        return display, await refresh
+
+    display, state = asyncio.run(main())
+    assert state == display.state == "on"
+    assert display.verified_at is None
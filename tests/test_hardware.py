@@ -0,0 +1,34 @@
+import asyncio
+
+from hardware import MockHardware
+
+
+def test_mock_xrandr_reports_the_last_power_state():
+    async def main():
+        hardware = MockHardware()
+        executor = hardware.executor(5)
+        left = hardware.display(executor, "HDMI-1", 60)
+        right = hardware.display(executor, "HDMI-2", 60)
+        states = [await left.refresh()]
+        await left.turn_on()
+        await right.turn_on()
+        states += [await left.refresh(), await right.refresh()]
+        await left.turn_off()
+        states += [await left.refresh(), await right.refresh()]
+        return states
+
+    assert asyncio.run(main()) == ["off", "on", "on", "off", "on"]
+
+
+def test_mock_xrandr_keeps_state_when_polling_runs_alongside(caplog):
+    async def main():
+        hardware = MockHardware(command_delay=0.01)
+        display = hardware.display(hardware.executor(5), "HDMI-1", 0.005)
+        watch = asyncio.create_task(display.watch())
+        await display.turn_on()
+        await asyncio.sleep(0.1)
+        watch.cancel()
+        return display.state
+
+    assert asyncio.run(main()) == "on"
+    assert "display.changed_outside" not in caplog.messages
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from heartbeat import HEARTBEAT_MODES, VOLATILE_FIELDS, HeartbeatDecoder, HeartbeatEncoder
+
+
+def heartbeats(count):
+    data = {"type": "heartbeat", "name": "left", "state": "on", "cpuTemp": 50, "isDoorOpen": False,
+            "cpuLoad": 12.5, "uptime": 1000}
+    for index in range(count):
+        data["uptime"] += 5
+        data["cpuLoad"] = 12.5 + index % 3
+        data["isDoorOpen"] = index in (4, 5)
+        data["state"] = "off" if index >= 7 else "on"
+        yield dict(data)
+
+
+@pytest.mark.parametrize("mode", HEARTBEAT_MODES)
+def test_round_trip_keeps_every_field_that_is_not_volatile(mode):
+    encoder, decoder = HeartbeatEncoder(mode, keyframe_interval=4), HeartbeatDecoder()
+    for index, data in enumerate(heartbeats(20)):
+        decoded = decoder.decode(encoder.encode(data))
+        assert {key: value for key, value in decoded.items() if key not in VOLATILE_FIELDS} == \
+            {key: value for key, value in data.items() if key not in VOLATILE_FIELDS}
+        if mode == "json" or index % 5 == 0:  # Keyframes carry everything
+            assert decoded == data
+
+
+def test_volatile_fields_wait_for_a_keyframe_or_a_large_move():
+    encoder, decoder = HeartbeatEncoder("delta", keyframe_interval=12), HeartbeatDecoder()
+    data = {"name": "left", "cpuLoad": 10.0, "uptime": 100}
+    decoder.decode(encoder.encode(data))
+
+    delta = json.loads(encoder.encode({**data, "cpuLoad": 15.0, "uptime": 105}))
+    assert delta["changes"] == {}
+    delta = json.loads(encoder.encode({**data, "cpuLoad": 20.5, "uptime": 110}))
+    assert delta["changes"] == {"cpuLoad": 20.5}
+    assert decoder.decode(json.dumps(delta)) == {"name": "left", "cpuLoad": 20.5, "uptime": 100}
+
+    encoder.reset()
+    assert decoder.decode(encoder.encode({**data, "uptime": 115})) == {**data, "uptime": 115}
+
+
+def test_binary_carries_long_strings_and_wide_numbers():
+    encoder, decoder = HeartbeatEncoder("binary"), HeartbeatDecoder()
+    data = {"type": "heartbeat", "name": "left", "note": "x" * 1000, "big": 2**40, "huge": 1e300, "small": -2**31}
+    frame = encoder.encode(data)
+    assert isinstance(frame, bytes)
+    assert decoder.decode(frame) == data
+
+
+def test_binary_falls_back_to_a_json_keyframe_for_values_it_cannot_carry():
+    encoder, decoder = HeartbeatEncoder("binary"), HeartbeatDecoder()
+    decoder.decode(encoder.encode({"name": "left", "state": "on"}))
+    data = {"name": "left", "state": "on", "note": "x" * 70000, "big": 2**70}
+    frame = encoder.encode(data)
+    assert isinstance(frame, str)
+    assert decoder.decode(frame) == data
+    assert decoder.decode(encoder.encode({**data, "state": "off"})) == {**data, "state": "off"}
+
+
+def test_delta_without_a_keyframe_asks_for_a_resync():
+    encoder = HeartbeatEncoder("delta")
+    encoder.encode({"name": "left", "state": "on"})
+    assert HeartbeatDecoder().decode(encoder.encode({"name": "left", "state": "off"})) is None
@@ -0,0 +1,84 @@
+import io
+import logging
+import queue
+
+from logs import DeferredQueueHandler, KeyValueFormatter, RateLimitFilter, RingBufferHandler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_record(event, level=logging.INFO, **fields):
+    record = logging.LogRecord("panel", level, __file__, 1, event, None, None)
+    record.fields = fields
+    return record
+
+
+def test_rate_limit_lets_a_burst_through_then_refills():
+    clock = FakeClock()
+    limiter = RateLimitFilter(rate=2.0, burst=3, clock=clock)
+    assert [limiter.filter(make_record("message.received")) for _ in range(5)] == [True, True, True, False, False]
+    assert limiter.filter(make_record("screen.changed"))  # Each event has its own bucket
+    clock.now = 0.5  # One token back
+    assert limiter.filter(make_record("message.received"))
+    assert not limiter.filter(make_record("message.received"))
+
+
+def test_rate_limit_never_drops_warnings():
+    limiter = RateLimitFilter(rate=1.0, burst=1, clock=FakeClock())
+    assert all(limiter.filter(make_record("spool.unwritable", logging.WARNING)) for _ in range(10))
+
+
+def test_sampling_keeps_one_record_in_n():
+    limiter = RateLimitFilter(rate=0, sample={"heartbeat.queued": 3})
+    kept = [limiter.filter(make_record("heartbeat.queued", seq=seq)) for seq in range(7)]
+    assert kept == [True, False, False, True, False, False, True]
+
+
+def test_next_record_through_carries_the_suppressed_count():
+    clock = FakeClock()
+    limiter = RateLimitFilter(rate=1.0, burst=1, clock=clock)
+    first = make_record("message.received")
+    assert limiter.filter(first)
+    assert "suppressed" not in first.fields
+    for _ in range(4):
+        limiter.filter(make_record("message.received"))
+    clock.now = 1.0
+    record = make_record("message.received", size=10)
+    assert limiter.filter(record)
+    assert record.fields == {"size": 10, "suppressed": 4}
+    clock.now = 2.0
+    record = make_record("message.received")
+    assert limiter.filter(record)
+    assert record.fields == {}
+
+
+def test_full_queue_drops_and_reports_the_count():
+    handler = DeferredQueueHandler(queue.Queue(2))
+    for n in range(5):
+        handler.handle(make_record("message.received", n=n))
+    assert handler.dropped == 3
+    assert handler.queue.get_nowait().fields == {"n": 0}
+    handler.handle(make_record("message.received", n=5))
+    assert handler.queue.get_nowait().fields == {"n": 1}
+    assert handler.queue.get_nowait().fields == {"n": 5, "dropped": 3}
+    handler.handle(make_record("message.received", n=6))
+    assert handler.queue.get_nowait().fields == {"n": 6}
+
+
+def test_ring_buffer_dumps_the_newest_records():
+    ring = RingBufferHandler(capacity=2)
+    ring.setFormatter(KeyValueFormatter())
+    for n in range(3):
+        ring.handle(make_record("message.received", n=n, text="a b"))
+    stream = io.StringIO()
+    ring.dump(stream)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith('INFO panel message.received n=1 text="a b"')
+    assert lines[1].endswith("n=2 text=\"a b\"")
@@ -0,0 +1,59 @@
+import pytest
+
+from metrics import Histogram, Metrics, format_labels
+
+
+def test_quantile_interpolates_inside_the_bucket():
+    histogram = Histogram(buckets=(1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 0]
+    assert histogram.quantile(0.25) == 1.0
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == 3  # Capped at the largest value seen
+
+
+def test_quantile_of_the_overflow_bucket_ends_at_the_max():
+    histogram = Histogram(buckets=(1, 2))
+    histogram.observe(10)
+    assert histogram.quantile(0.5) == pytest.approx(6)
+    assert histogram.quantile(1.0) == 10
+
+
+def test_quantile_of_an_empty_histogram_is_none():
+    assert Histogram().quantile(0.99) is None
+
+
+def test_label_values_are_escaped():
+    assert format_labels(()) == ""
+    assert format_labels((("path", 'C:\\a "b"\nc'),)) == '{path="C:\\\\a \\"b\\"\\nc"}'
+
+
+def test_render_writes_cumulative_buckets_and_collectors():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.observe("panel_screen_command_seconds", 0.05, command="on")
+    metrics.observe("panel_screen_command_seconds", 0.5, command="on")
+    metrics.observe("panel_screen_command_seconds", 5, command="on")
+    metrics.add_collector(lambda: [("panel_reconnects_total", "counter", {"reason": "closed"}, 3),
+                                   ("panel_spool_bytes", "gauge", {}, None)])
+    assert metrics.render().splitlines() == [
+        "# TYPE panel_screen_command_seconds histogram",
+        'panel_screen_command_seconds_bucket{command="on",le="0.1"} 1',
+        'panel_screen_command_seconds_bucket{command="on",le="1.0"} 2',
+        'panel_screen_command_seconds_bucket{command="on",le="+Inf"} 3',
+        'panel_screen_command_seconds_sum{command="on"} 5.55',
+        'panel_screen_command_seconds_count{command="on"} 3',
+        "# TYPE panel_reconnects_total counter",
+        'panel_reconnects_total{reason="closed"} 3.0',
+    ]
+
+
+def test_summary_reports_milliseconds_for_recorded_series_only():
+    metrics = Metrics()
+    for _ in range(100):
+        metrics.observe("panel_loop_lag_seconds", 0.002)
+    metrics.observe("panel_loop_lag_seconds", 0.3)
+    metrics.observe("panel_outbox_send_seconds", 0.004, kind="heartbeat")
+    metrics.observe("panel_outbox_send_seconds", 2.0, kind="acknowledgement")
+    summary = metrics.summary()
+    assert summary == {"loopLagP99": 2, "loopLagMax": 300, "heartbeatSendP99": 4}
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import threading
+
+import websockets
+
+from conftest import RecordingWebSocket
+from outbox import PRIORITY_ACK, PRIORITY_EVENT, PRIORITY_HEARTBEAT, Outbox, Spool
+
+
+class ClosedWebSocket:
+    async def send(self, message):
+        raise websockets.ConnectionClosedError(None, None)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_messages_go_out_in_priority_order():
+    async def main():
+        websocket = RecordingWebSocket()
+        outbox = Outbox()
+        outbox.attach(websocket)
+        outbox.put({"type": "heartbeat"}, PRIORITY_HEARTBEAT)
+        outbox.put({"type": "sensorEvent", "n": 1}, PRIORITY_EVENT)
+        outbox.put({"type": "acknowledgement"}, PRIORITY_ACK)
+        outbox.put({"type": "sensorEvent", "n": 2}, PRIORITY_EVENT)
+        await outbox.wait_sent(1)
+        await outbox.detach()
+        return websocket.sent
+
+    sent = run(main())
+    assert [message["type"] for message in sent] == ["acknowledgement", "sensorEvent", "sensorEvent", "heartbeat"]
+    assert [message.get("n") for message in sent[1:3]] == [1, 2]
+
+
+def test_queued_heartbeats_coalesce_into_the_newest():
+    async def main():
+        websocket = RecordingWebSocket()
+        outbox = Outbox()
+        outbox.attach(websocket)
+        for seq in range(3):
+            outbox.put({"type": "heartbeat", "seq": seq}, PRIORITY_HEARTBEAT, coalesce_key="heartbeat")
+        await outbox.wait_sent(1)
+        await outbox.detach()
+        return websocket.sent
+
+    assert run(main()) == [{"type": "heartbeat", "seq": 2}]
+
+
+def test_full_queue_evicts_the_lowest_priority(tmp_path):
+    async def main():
+        spool = Spool(str(tmp_path / "spool.jsonl"))
+        outbox = Outbox(spool, max_messages=2)
+        outbox.websocket = RecordingWebSocket()  # Connected, sender not started
+        outbox.put({"type": "heartbeat"}, PRIORITY_HEARTBEAT)
+        outbox.put({"type": "sensorEvent", "n": 1}, PRIORITY_EVENT, spool=True)
+        outbox.put({"type": "acknowledgement"}, PRIORITY_ACK, spool=True)
+        assert outbox.dropped == 1  # The heartbeat
+        outbox.put({"type": "acknowledgement", "n": 2}, PRIORITY_ACK, spool=True)
+        outbox.put({"type": "heartbeat"}, PRIORITY_HEARTBEAT)
+        assert outbox.dropped == 2  # The new heartbeat found nothing worse to evict
+        return [message.payload for _, _, message in sorted(outbox.queue)], spool.buffer
+
+    queued, spooled = run(main())
+    assert queued == [{"type": "acknowledgement"}, {"type": "acknowledgement", "n": 2}]
+    assert [json.loads(line) for line in spooled] == [{"type": "sensorEvent", "n": 1}]
+
+
+def test_offline_messages_are_spooled_or_dropped(tmp_path):
+    async def main():
+        spool = Spool(str(tmp_path / "spool.jsonl"))
+        outbox = Outbox(spool)
+        outbox.put({"type": "acknowledgement"}, PRIORITY_ACK, spool=True)
+        outbox.put({"type": "heartbeat"}, PRIORITY_HEARTBEAT)
+        return outbox.dropped, spool.buffer
+
+    dropped, spooled = run(main())
+    assert dropped == 1
+    assert [json.loads(line) for line in spooled] == [{"type": "acknowledgement"}]
+
+
+def test_spool_is_replayed_in_order_behind_live_acks(tmp_path):
+    async def main():
+        spool = Spool(str(tmp_path / "spool.jsonl"))
+        for n in range(5):
+            spool.append({"type": "sensorEvent", "n": n})
+        await spool.flush()
+        spool.append({"type": "sensorEvent", "n": 5})  # Still buffered
+        websocket = RecordingWebSocket()
+        outbox = Outbox(spool, replay_batch=2)
+        outbox.attach(websocket)
+        outbox.put({"type": "acknowledgement"}, PRIORITY_ACK)
+        await asyncio.sleep(0.2)
+        await outbox.wait_sent(1)
+        await outbox.detach()
+        return websocket.sent, await spool.take()
+
+    sent, left = run(main())
+    assert sent[0] == {"type": "acknowledgement"}
+    assert [message["n"] for message in sent[1:]] == [0, 1, 2, 3, 4, 5]
+    assert left == []
+    assert not (tmp_path / "spool.jsonl").exists()
+
+
+def test_detach_spools_what_was_not_sent(tmp_path):
+    async def main():
+        spool = Spool(str(tmp_path / "spool.jsonl"))
+        outbox = Outbox(spool)
+        outbox.attach(ClosedWebSocket())
+        outbox.put({"type": "acknowledgement"}, PRIORITY_ACK, spool=True)
+        outbox.put({"type": "heartbeat"}, PRIORITY_HEARTBEAT)
+        await asyncio.sleep(0.1)
+        await outbox.detach()
+        return outbox, await spool.take()
+
+    outbox, spooled = run(main())
+    assert spooled == [{"type": "acknowledgement"}]
+    assert outbox.dropped == 1
+    assert not outbox.queue
+
+
+def test_spool_survives_a_cancelled_replay(tmp_path):
+    class SlowSpool(Spool):
+        def _take(self, lines):
+            started.set()
+            release.wait(5)
+            try:
+                return super()._take(lines)
+            finally:
+                finished.set()
+
+    started, release, finished = threading.Event(), threading.Event(), threading.Event()
+
+    async def main():
+        spool = SlowSpool(str(tmp_path / "spool.jsonl"))
+        for n in range(3):
+            spool.append({"type": "acknowledgement", "n": n})
+        await spool.flush()
+        outbox = Outbox(spool)
+        outbox.attach(RecordingWebSocket())
+        await asyncio.to_thread(started.wait, 5)
+        detach = asyncio.create_task(outbox.detach())  # Cancels the sender mid-read
+        await asyncio.sleep(0.05)
+        release.set()
+        await detach
+        await asyncio.to_thread(finished.wait, 5)  # The records are in the replay file by now
+        return await spool.take()
+
+    assert [record["n"] for record in run(main())] == [0, 1, 2]
+
+
+def test_sender_survives_a_message_that_cannot_be_encoded():
+    def encode(message):
+        if message.payload.get("bad"):
+            raise ValueError("cannot encode")
+        return json.dumps(message.payload)
+
+    async def main():
+        websocket = RecordingWebSocket()
+        outbox = Outbox(encode=encode)
+        outbox.attach(websocket)
+        outbox.put({"type": "acknowledgement", "bad": True}, PRIORITY_ACK)
+        outbox.put({"type": "heartbeat"}, PRIORITY_HEARTBEAT)
+        await outbox.wait_sent(1)
+        running = not outbox._sender.done()
+        await outbox.detach()
+        return websocket.sent, outbox.dropped, running
+
+    sent, dropped, running = run(main())
+    assert sent == [{"type": "heartbeat"}]
+    assert dropped == 1
+    assert running
+
+
+def test_spool_compacts_to_the_newest_half(tmp_path):
+    async def main():
+        spool = Spool(str(tmp_path / "spool.jsonl"), max_bytes=1000)
+        for n in range(100):
+            spool.append({"n": n})
+        await spool.flush()
+        return spool, await spool.take()
+
+    spool, records = run(main())
+    assert records
+    assert records[-1] == {"n": 99}
+    assert [record["n"] for record in records] == list(range(100 - len(records), 100))
+    assert spool.dropped == 100 - len(records)
+
+
+def test_replayed_records_stay_on_disk_until_sent(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+
+    async def main():
+        spool = Spool(path)
+        for n in range(3):
+            spool.append({"n": n})
+        await spool.flush()
+        first = await spool.take()
+        # A crash before done(): a new process finds the records again, ahead of newer ones
+        restarted = Spool(path)
+        restarted.append({"n": 3})
+        second = await restarted.take()
+        await restarted.done()
+        return first, second, await restarted.take()
+
+    first, second, third = run(main())
+    assert [record["n"] for record in first] == [0, 1, 2]
+    assert [record["n"] for record in second] == [0, 1, 2, 3]
+    assert third == []
+
+
+def test_detach_puts_unsent_replay_records_back_before_the_queue(tmp_path):
+    class StallingWebSocket(RecordingWebSocket):
+        async def send(self, message):
+            if self.sent:
+                await asyncio.Event().wait()
+            await super().send(message)
+
+    async def main():
+        spool = Spool(str(tmp_path / "spool.jsonl"))
+        for n in range(5):
+            spool.append({"type": "sensorEvent", "n": n})
+        await spool.flush()
+        websocket = StallingWebSocket()
+        outbox = Outbox(spool, replay_batch=2)
+        outbox.attach(websocket)
+        await asyncio.sleep(0.1)  # Record 0 went out, the send of record 1 hangs
+        outbox.put({"type": "sensorEvent", "live": True}, PRIORITY_EVENT, spool=True)
+        outbox.put({"type": "acknowledgement"}, PRIORITY_ACK, spool=True)
+        await outbox.detach()
+        return websocket.sent, await spool.take()
+
+    sent, spooled = run(main())
+    assert [message["n"] for message in sent] == [0]
+    assert spooled == [{"type": "sensorEvent", "n": n} for n in range(1, 5)] + [
+        {"type": "acknowledgement"}, {"type": "sensorEvent", "live": True}]
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import RecordingWebSocket
+from connection import PanelConnection
+from display import FakeDisplay
+from executor import StubExecutor
+from gpio_handler import SimulatedGPIO
+from panel_controller import PanelController
+from panel_hub import PanelHub
+
+
+def make_hub(tmp_path, names=("left", "right")):
+    connection = PanelConnection("cabinet")
+    connection.spool.path = str(tmp_path / "spool.jsonl")
+    executor, gpio = StubExecutor(), SimulatedGPIO()
+    panels = [PanelController(executor=executor, display=FakeDisplay(f"HDMI-{index}"), gpio=gpio, name=name,
+                              output=f"HDMI-{index}", connection=connection)
+              for index, name in enumerate(names, 1)]
+    return PanelHub(panels, executor)
+
+
+def instruction(instruction_id, name=None):
+    data = {"type": "instruction", "to": "panel", "instructionId": instruction_id, "instruction": "on"}
+    if name is not None:
+        data["name"] = name
+    return json.dumps(data)
+
+
+def test_panels_share_the_hub_connection(tmp_path):
+    hub = make_hub(tmp_path)
+    assert all(panel.connection is hub.connection for panel in hub.panels)
+    assert hub.connection.panels == hub.panels
+    assert hub.client_name == "cabinet"
+
+
+def test_panels_on_different_connections_are_rejected():
+    panels = [PanelController(executor=StubExecutor(), display=FakeDisplay(), gpio=SimulatedGPIO(), name=name)
+              for name in ("left", "right")]
+    with pytest.raises(ValueError):
+        PanelHub(panels)
+
+
+def test_instructions_are_routed_by_name_or_acknowledged_as_unknown(tmp_path):
+    hub = make_hub(tmp_path)
+
+    async def main():
+        websocket = RecordingWebSocket()
+        hub.connection.websocket = websocket
+        hub.connection.outbox.attach(websocket)
+        for message in (instruction("1", "right"), instruction("2", "nobody"), instruction("3")):
+            await hub.handle_message(message, websocket)
+        for panel in hub.panels:
+            await panel.dispatcher.drain()
+        await hub.connection.outbox.wait_sent(1)
+        await hub.connection.outbox.detach()
+        return websocket.sent
+
+    acks = {message["instructionId"]: message for message in asyncio.run(main())
+            if message["type"] == "acknowledgement"}
+    assert (acks["1"]["status"], acks["1"]["panelName"]) == ("completed", "right")
+    assert acks["2"]["status"] == acks["3"]["status"] == "unknownPanel"
+    assert [panel.display.state for panel in hub.panels] == ["unknown", "on"]
+
+
+def test_heartbeats_go_out_as_one_batch(tmp_path):
+    hub = make_hub(tmp_path)
+
+    async def main():
+        websocket = RecordingWebSocket()
+        hub.connection.websocket = websocket
+        hub.connection.outbox.attach(websocket)
+        await hub.send_heartbeat_to_server()
+        await hub.connection.outbox.wait_sent(1)
+        await hub.connection.outbox.detach()
+        return websocket.sent
+
+    batch, = asyncio.run(main())
+    assert batch["type"] == "heartbeatBatch"
+    assert [heartbeat["name"] for heartbeat in batch["heartbeats"]] == ["left", "right"]
+
+
+def test_hub_only_offers_and_accepts_json(tmp_path):
+    hub = make_hub(tmp_path)
+    hub.connection.heartbeat_modes = ["delta", "json"]
+    hub = PanelHub(hub.panels)
+
+    async def main():
+        websocket = RecordingWebSocket()
+        await hub.register(websocket)
+        return websocket.sent
+
+    assert {tuple(message["heartbeatModes"]) for message in asyncio.run(main())} == {("json",)}
+    hub.connection.set_heartbeat_mode("delta")
+    assert hub.connection.heartbeat_encoder.mode == "json"
+
+
+def panel_entry(name, output, first_pin, **pins):
+    pins = {"door_sensor_pin": first_pin, "sector_status_pin": first_pin + 1, "button_pin": first_pin + 2, **pins}
+    return {"name": name, "output": output, "pins": pins}
+
+
+@pytest.mark.parametrize("config, error", [
+    ([{"name": "left", "pins": {"door_sensor_pin": 17, "sector_status_pin": 27, "button_pin": 4}}], "no output"),
+    ([{"name": "left", "output": "HDMI-1", "pins": {"door_sensor_pin": 17}}], "no sector_status_pin, button_pin"),
+    ([panel_entry("left", "HDMI-1", 5), panel_entry("right", "HDMI-1", 11, led1_pin=23, led2_pin=24)],
+     "both use output HDMI-1"),
+    ([panel_entry("left", "HDMI-1", 5), panel_entry("right", "HDMI-2", 7, led1_pin=23, led2_pin=24)],
+     "GPIO 7 is both left button_pin and right door_sensor_pin"),
+    ([panel_entry("left", "HDMI-1", 5), panel_entry("right", "HDMI-2", 11)], "GPIO 22 is both left led1_pin"),
+    ([panel_entry("left", "HDMI-1", 5), panel_entry("left", "HDMI-2", 11, led1_pin=23, led2_pin=24)],
+     "name left is used twice"),
+])
+def test_from_config_rejects_missing_or_shared_outputs_and_pins(tmp_path, config, error):
+    path = tmp_path / "panels.json"
+    path.write_text(json.dumps(config))
+    with pytest.raises(ValueError, match=error):
+        PanelHub.from_config(str(path), gpio=SimulatedGPIO())
@@ -0,0 +1,100 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from connection import PanelConnection
+from display import FakeDisplay
+from executor import StubExecutor
+from gpio_handler import SimulatedGPIO
+from panel_controller import PanelController
+from reconnect import DecorrelatedJitterBackoff, FixedDelay, make_reconnect_policy
+
+
+def make_panel(tmp_path):
+    connection = PanelConnection("left")
+    connection.spool.path = str(tmp_path / "spool.jsonl")
+    connection.resume_window = 0.01
+    return PanelController(executor=StubExecutor(), display=FakeDisplay(), gpio=SimulatedGPIO(), name="left",
+                           connection=connection)
+
+
+def test_backoff_stays_between_base_and_cap_and_spreads_out():
+    policy = DecorrelatedJitterBackoff(base=0.5, cap=10, rng=random.Random(7))
+    previous = policy.base
+    delays = []
+    for _ in range(200):
+        delay = policy.next_delay()
+        assert policy.base <= delay <= min(policy.cap, previous * 3)
+        delays.append(delay)
+        previous = delay
+    assert max(delays) == 10
+    assert len(set(delays)) > 100
+
+
+def test_backoff_starts_over_after_reset():
+    policy = DecorrelatedJitterBackoff(base=0.5, cap=60, rng=random.Random(7))
+    for _ in range(20):
+        policy.next_delay()
+    policy.reset()
+    assert policy.next_delay() <= 1.5
+
+
+def test_fixed_policy_uses_its_own_delay():
+    policy = make_reconnect_policy("fixed", base=0.5, cap=60, delay=5)
+    assert isinstance(policy, FixedDelay)
+    assert [policy.next_delay() for _ in range(3)] == [5, 5, 5]
+    with pytest.raises(ValueError):
+        make_reconnect_policy("sometimes")
+
+
+def test_connection_reads_reconnect_delay(monkeypatch):
+    monkeypatch.setenv("RECONNECT_POLICY", "fixed")
+    monkeypatch.setenv("RECONNECT_CAP", "60")
+    monkeypatch.setenv("RECONNECT_DELAY", "2")
+    assert PanelConnection("left").reconnect_policy.next_delay() == 2
+
+
+def test_nothing_to_resume_or_blank_before_the_first_registration(tmp_path):
+    panel = make_panel(tmp_path)
+
+    async def main():
+        panel.connection_lost()
+        return panel.connection.blank_task, panel.connection.can_resume()
+
+    assert asyncio.run(main()) == (None, False)
+
+
+def test_resume_only_within_the_window_after_a_registered_session(tmp_path):
+    panel = make_panel(tmp_path)
+    connection = panel.connection
+    connection.registered_once = True
+
+    async def main():
+        await panel.display.turn_on()
+        panel.connection_lost()
+        within = connection.can_resume()
+        await connection.blank_task
+        return within, connection.can_resume()
+
+    assert asyncio.run(main()) == (True, False)
+    assert panel.display.state == "off"
+
+
+@pytest.mark.parametrize("uptime, reset", [(31, True), (5, False)])
+def test_backoff_resets_only_after_a_stable_connection(tmp_path, uptime, reset):
+    panel = make_panel(tmp_path)
+    connection = panel.connection
+    connection.reconnect_policy = policy = DecorrelatedJitterBackoff(base=0.5, cap=60, rng=random.Random(7))
+    for _ in range(10):
+        policy.next_delay()
+    grown = policy.delay
+    connection.reconnect_stats.connected()
+    connection.reconnect_stats.connected_at = time.monotonic() - uptime
+
+    async def main():
+        panel.connection_lost()
+
+    asyncio.run(main())
+    assert policy.delay == (policy.base if reset else grown)
@@ -0,0 +1,116 @@
+import asyncio
+import random
+
+import pytest
+
+from scheduler import HeartbeatScheduler, phase_for
+
+
+def collect(loop, scheduler, count, work=0.0, on_tick=None):
+    # Runs the scheduler for ``count`` ticks; each tick takes ``work`` seconds
+    async def run():
+        ticks = []
+        async for tick in scheduler.ticks():
+            ticks.append(tick)
+            if on_tick is not None:
+                on_tick(len(ticks), scheduler)
+            if len(ticks) == count:
+                return ticks
+            await asyncio.sleep(work)
+    return loop.run_until_complete(run())
+
+
+def test_ticks_stay_on_the_grid_when_sending_takes_time(virtual_loop):
+    scheduler = HeartbeatScheduler(5, clock=virtual_loop.time)
+    ticks = collect(virtual_loop, scheduler, 10, work=1.3)
+    assert ticks == pytest.approx([5.0 * k for k in range(10)])
+
+
+def test_missed_ticks_collapse_into_one(virtual_loop):
+    scheduler = HeartbeatScheduler(5, clock=virtual_loop.time)
+
+    async def run():
+        ticks = []
+        async for tick in scheduler.ticks():
+            ticks.append(tick)
+            if len(ticks) == 2:
+                await asyncio.sleep(12)  # Loop held past two deadlines
+            if len(ticks) == 5:
+                return ticks
+
+    assert virtual_loop.run_until_complete(run()) == pytest.approx([0.0, 5.0, 17.0, 20.0, 25.0])
+
+
+def test_phase_offsets_the_grid_but_the_first_tick_is_immediate(virtual_loop):
+    scheduler = HeartbeatScheduler(4, phase=0.25, clock=virtual_loop.time)
+    assert collect(virtual_loop, scheduler, 4) == pytest.approx([0.0, 1.0, 5.0, 9.0])
+
+
+def test_phase_for_is_stable_and_spread():
+    assert phase_for("panel-1") == phase_for("panel-1")
+    phases = [phase_for(f"panel-{index}") for index in range(1000)]
+    assert all(0.0 <= phase < 1.0 for phase in phases)
+    # Roughly uniform: every tenth of the interval gets some panels
+    assert len({int(phase * 10) for phase in phases}) == 10
+
+
+def test_jitter_moves_ticks_without_drifting(virtual_loop):
+    scheduler = HeartbeatScheduler(5, jitter=0.5, rng=random.Random(1), clock=virtual_loop.time)
+    ticks = collect(virtual_loop, scheduler, 50)
+    errors = [tick - 5.0 * k for k, tick in enumerate(ticks)]
+    assert max(abs(error) for error in errors) <= 0.5
+    assert len(set(round(error, 6) for error in errors[1:])) > 1
+
+
+def test_set_interval_spaces_the_next_ticks_from_the_last_one(virtual_loop):
+    def on_tick(count, scheduler):
+        if count == 3:
+            scheduler.set_interval(2)
+
+    scheduler = HeartbeatScheduler(5, clock=virtual_loop.time)
+    ticks = collect(virtual_loop, scheduler, 6, on_tick=on_tick)
+    assert ticks == pytest.approx([0.0, 5.0, 10.0, 12.0, 14.0, 16.0])
+
+
+def test_set_interval_wakes_a_waiting_scheduler(virtual_loop):
+    scheduler = HeartbeatScheduler(60, clock=virtual_loop.time)
+
+    async def run():
+        virtual_loop.call_later(1, scheduler.set_interval, 2)
+        ticks = []
+        async for tick in scheduler.ticks():
+            ticks.append(tick)
+            if len(ticks) == 3:
+                return ticks
+
+    assert virtual_loop.run_until_complete(run()) == pytest.approx([0.0, 2.0, 4.0])
+
+
+def test_adaptive_interval_follows_is_active(virtual_loop):
+    door = {"open": False}
+    scheduler = HeartbeatScheduler(5, fast_interval=1, idle_interval=20, active_hold=0,
+                                   is_active=lambda: door["open"], clock=virtual_loop.time)
+    virtual_loop.call_at(25.5, door.update, {"open": True})
+    virtual_loop.call_at(28.5, door.update, {"open": False})
+    ticks = collect(virtual_loop, scheduler, 8)
+    # Idle every 20s; the open door is noticed within the fast interval, then
+    # fast ticks continue from the last idle tick until it closes again
+    assert ticks == pytest.approx([0.0, 20.0, 26.0, 27.0, 28.0, 29.0, 49.0, 69.0])
+
+
+def test_mark_active_holds_the_fast_interval(virtual_loop):
+    def on_tick(count, scheduler):
+        if count == 1:
+            scheduler.mark_active()
+
+    scheduler = HeartbeatScheduler(5, fast_interval=1, idle_interval=10, active_hold=3, clock=virtual_loop.time)
+    ticks = collect(virtual_loop, scheduler, 6, on_tick=on_tick)
+    assert scheduler.current_interval() == 10
+    assert ticks == pytest.approx([0.0, 1.0, 2.0, 3.0, 13.0, 23.0])
+
+
+def test_current_interval_without_adaptive_settings_ignores_activity():
+    scheduler = HeartbeatScheduler(5, is_active=lambda: True)
+    scheduler.mark_active()
+    assert not scheduler.adaptive
+    assert scheduler.current_interval() == 5
@@ -0,0 +1,18 @@
+import psutil
+
+from telemetry import SystemTelemetry
+
+
+def test_cpu_load_is_sampled_once_per_interval(tmp_path, monkeypatch):
+    samples = iter([0.0, 37.5, 80.0])
+    monkeypatch.setattr(psutil, "cpu_percent", lambda interval=None: next(samples))
+    now = [100.0]
+    telemetry = SystemTelemetry(str(tmp_path), cpu_interval=5, clock=lambda: now[0])
+
+    loads = []
+    for at in (100.5, 101.0, 105.0, 105.1, 109.9, 110.0):
+        now[0] = at
+        loads.append(telemetry.system_metrics()["cpuLoad"])
+    assert loads == [None, None, 37.5, 37.5, 37.5, 80.0]
+    assert telemetry.cpu_temperature() is None
+    telemetry.close()